@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import contextlib
+import platform
+import tempfile
+import statistics
+import subprocess
+import numpy as np
+from typing import List, Dict, Callable, Union
+
+REPO_DIR = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(REPO_DIR)) #Lets the suite run from a plain checkout as well as an installed package
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from shg_simulation.src.sys_config import package_version
+from shg_simulation.src.data_classes import FitConfig, ChannelData
+from shg_simulation.src.fit_engine import load_fit_models, candidate_point_groups, fit_all_point_groups, channel_models, model_entry
+from shg_simulation.src.fit_scheduler import FitScheduler, worker_model
+from shg_simulation.src.utils import read_data, polar_plot
+from shg_simulation.src.cache import DATA_CACHE, FIT_CACHE
+from shg_simulation.src.lod import LOD_CACHE
+from shg_simulation.src.batch import GEOMETRY_CHANNELS
+from shg_simulation.src.simulation import simulate_channels
+from shg_simulation.src.symmetry import get_reduction
+from shg_simulation.src import cli
+
+HISTORY_PATH = REPO_DIR / 'benchmarks' / 'history.json'
+MINI_PLOT_PIXELS = 290
+#(point group, source, sys, channels) whose serial and pool fits are checked against each other, quadrupole intensities
+#reach 8φ so the pool workers have to use the same harmonic orders as the parent
+CONSISTENCY_CASES = [('C_4h', 'e_q', 'Tetragonal', ['SS', 'PS']), ('T_h', 'e_q', 'Cubic', ['SS', 'PS'])]
+
+def synthetic_config(num_points: int, channels: List[str], sys_name: str, source: str, models: Dict,
+                     noise: float, rng: np.random.Generator) -> FitConfig:
+    #A sample of one candidate point group of the system, simulated with random tensor elements plus gaussian noise, so the
+    #fits run on the generated models of every channel (and the hand written ones that replace them)
+    config = FitConfig(geometry='refl' if channels[0] in GEOMETRY_CHANNELS['refl'] else 'trans', channels=channels,
+                       source=source, sys=sys_name, plane='001')
+    point_groups = [point_group for point_group in candidate_point_groups(config, channel_models(config, channels[0], models))
+                    if get_reduction(point_group, source).labels]
+    if not point_groups:
+        raise SystemExit(f"No fit models for source {source} / {sys_name}")
+    point_group = point_groups[rng.integers(len(point_groups))]
+    labels = get_reduction(point_group, source).labels
+    phi = np.linspace(0, 2 * np.pi, num_points, endpoint=False)
+    intensity = simulate_channels(point_group, source, config.geometry, channels, phi,
+                                  elements={label: float(value) for label, value in zip(labels, rng.uniform(-1, 1, len(labels)))})
+    for channel in channels:
+        r = intensity[channel] + rng.normal(0, noise * max(float(intensity[channel].max()), 1e-12), num_points)
+        config.data[channel] = (phi, r)
+    return config
+
+def write_csvs(config: FitConfig, directory: pathlib.Path, sample: str) -> Dict[str, pathlib.Path]:
+    files = {}
+    for channel in config.channels:
+        phi, r = config.data[channel]
+        files[channel] = directory / f'{sample}_{channel}.csv'
+        np.savetxt(files[channel], np.column_stack([phi, r]), delimiter=',')
+    return files
+
+def clear_caches() -> None:
+    DATA_CACHE.clear()
+    FIT_CACHE.clear()
+    LOD_CACHE.clear()
+
+def time_it(func: Callable, repeat: int, setup: Union[Callable, None]=None) -> Dict:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times), 'runs': repeat}
+
+def render(data, pixels: Union[int, None]) -> None:
+    fig, ax = polar_plot(title='bench', data=data, width=MINI_PLOT_PIXELS / 70, height=MINI_PLOT_PIXELS / 70,
+                         dpi=70, data_color='blue', pixels=pixels)
+    FigureCanvasAgg(fig).draw()
+
+def run_cli(argv: List[str]) -> None:
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        cli.main(argv)
+
+def check_pool_matches_serial(args: argparse.Namespace) -> List[str]:
+    #Rankings and R² of the pool have to match the serial fits, and every model a worker rebuilds has to carry the parent's
+    #harmonics, parameters and bounds (a fit can converge from a poorer start, so matching results alone can hide a gap)
+    rng = np.random.default_rng(args.seed)
+    phi = np.linspace(0, 2 * np.pi, 720, endpoint=False)
+    mismatches = []
+    scheduler = FitScheduler(max_workers=max(2, args.workers)) #At least two workers, one would fit inline
+    try:
+        for point_group, source, sys_name, channels in CONSISTENCY_CASES:
+            elements = {label: float(value) for label, value in zip(get_reduction(point_group, source).labels,
+                                                                    rng.uniform(-1, 1, 64))}
+            intensity = simulate_channels(point_group, source, 'refl', channels, phi, elements=elements)
+            config = FitConfig(geometry='refl', channels=channels, source=source, sys=sys_name, plane='001',
+                               data={channel: ChannelData(phi=phi, r=r + rng.normal(0, args.noise * r.max(), r.size))
+                                     for channel, r in intensity.items()})
+            serial = fit_all_point_groups(config, use_cache=False)
+            pool = scheduler.run(config, use_cache=False)
+            for channel in channels:
+                for name, model in channel_models(config, channel, load_fit_models()).items():
+                    rebuilt = worker_model(model_entry(model))
+                    if (rebuilt.harmonics, rebuilt.param_names, rebuilt.bounds) != (model.harmonics, model.param_names, model.bounds):
+                        mismatches.append(f"{name} {source} {channel}: pool worker model differs from the parent's")
+                ranked = [[(fit.name, round(float(fit.r2), 6)) for fit in fits if fit.channel == channel] for fits in (serial, pool)]
+                if ranked[0] != ranked[1]:
+                    mismatches.append(f"{point_group} {source} {channel}: serial {ranked[0]} != pool {ranked[1]}")
+    finally:
+        scheduler.shutdown()
+    return mismatches
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Dict]:
+    rng = np.random.default_rng(args.seed)
+    models = load_fit_models()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        for num_points in args.points:
+            config = synthetic_config(num_points, args.channels, args.sys, args.source, models, args.noise, rng)
+            files = write_csvs(config, directory, f'bench{num_points}')
+            loaded = {channel: read_data(data_path=files[channel], header=False) for channel in config.channels}
+            fit_config = FitConfig(geometry=config.geometry, channels=config.channels, source=config.source,
+                                   sys=config.sys, plane=config.plane, data=loaded)
+            linear_config = FitConfig(geometry=config.geometry, channels=config.channels, source=config.source,
+                                      sys=config.sys, plane=config.plane, data=loaded, fit_mode='linear')
+            data = loaded[config.channels[0]]
+            benches = {
+                'read_data': (lambda: [read_data(data_path=file, header=False) for file in files.values()], clear_caches),
+                'read_data_cached': (lambda: [read_data(data_path=file, header=False) for file in files.values()], None),
+                'fit_serial': (lambda: fit_all_point_groups(fit_config, models, use_cache=False), None),
+                'fit_pool': (lambda: scheduler.run(fit_config, models, use_cache=False), None),
+                'fit_linear': (lambda: fit_all_point_groups(linear_config, models, use_cache=False), None),
+                'simulate': (lambda: simulate_channels('C_1', 'e_q', config.geometry, config.channels, data.phi), None),
+                'polar_plot_full': (lambda: render(data, None), None),
+                'polar_plot_lod': (lambda: render(data, MINI_PLOT_PIXELS), LOD_CACHE.clear),
+                'batch_cli': (lambda: run_cli([str(directory / f'bench{num_points}_*.csv'), '--geometry', config.geometry,
+                                                '--source', config.source, '--sys', config.sys, '--no-cache',
+                                                '-o', str(directory / 'results.csv')]), clear_caches),
+            }
+            scheduler = FitScheduler(max_workers=args.workers or None)
+            scheduler.run(fit_config, models, use_cache=False) #Pool start up is a one off cost, it is not part of the timing
+            try:
+                for name, (func, setup) in benches.items():
+                    if args.only and name not in args.only:
+                        continue
+                    key = f'{name}[n={num_points},channels={len(config.channels)}]'
+                    results[key] = time_it(func, args.repeat, setup)
+                    print(f"{key:<48}median {results[key]['median'] * 1000:10.3f} ms   min {results[key]['min'] * 1000:10.3f} ms", flush=True)
+            finally:
+                scheduler.shutdown()
+    return results
+
+def git_commit() -> Union[str, None]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(file_path: pathlib.Path) -> List[Dict]:
+    if not file_path.exists():
+        return []
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+def compare(results: Dict[str, Dict], baseline: Dict, threshold: float) -> List[str]:
+    #Returns the benchmarks whose median got slower than the baseline by more than threshold
+    regressions = []
+    print(f"\nCompared with {baseline.get('label') or baseline['commit']} ({baseline['timestamp']}):")
+    for key, result in results.items():
+        if key not in baseline['results']:
+            continue
+        ratio = result['median'] / max(baseline['results'][key]['median'], 1e-12)
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f"  {key:<48}{ratio:6.2f}x{flag}")
+    return regressions
+
+def main(argv: Union[List[str], None]=None) -> int:
+    parser = argparse.ArgumentParser(description='Time data loading, fitting and plotting on synthetic RA-SHG data.')
+    parser.add_argument('--points', type=int, nargs='+', default=[1_000, 100_000], help='points per channel, one run per value')
+    parser.add_argument('--channels', nargs='+', default=['SS', 'PP'], help='channels per synthetic sample')
+    parser.add_argument('--sys', default='Hexagonal')
+    parser.add_argument('--source', default='e_d')
+    parser.add_argument('--noise', type=float, default=0.02, help='gaussian noise relative to the signal maximum')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=0, help='processes for the pool benchmarks, 0 uses every core')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', default=None, help='run only these benchmarks (e.g. fit_serial read_data)')
+    parser.add_argument('--history', default=str(HISTORY_PATH), help='json file results are appended to')
+    parser.add_argument('--label', default='', help='name stored with this run, e.g. a release tag')
+    parser.add_argument('--no-record', action='store_true', help='do not append this run to the history')
+    parser.add_argument('--compare', nargs='?', const='latest', default=None, metavar='LABEL',
+                        help='compare with the latest recorded run, or the latest run with this label')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown counted as a regression (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    history_path = pathlib.Path(args.history)
+    history = load_history(history_path)
+    mismatches = check_pool_matches_serial(args)
+    for mismatch in mismatches:
+        print(f"POOL MISMATCH {mismatch}")
+    results = run_suite(args)
+    entry = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'label': args.label, 'version': package_version(),
+             'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+             'cpus': os.cpu_count(), 'results': results}
+
+    regressions = []
+    if args.compare is not None:
+        baselines = [run for run in history if args.compare == 'latest' or run.get('label') == args.compare]
+        if not baselines:
+            print(f"\nNo recorded run to compare with in {history_path}")
+        else:
+            regressions = compare(results, baselines[-1], args.threshold)
+    if not args.no_record:
+        history.append(entry)
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(history_path, 'w') as file:
+            json.dump(history, file, indent=2)
+        print(f"\nRecorded to {history_path}")
+    return 1 if regressions or mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,50 @@
-from .data_classes import FitManager, FitConfig, FitInputManager, SimInputManager
-from .custom_widgets import (
-    PlotWidget, GroupLabel, GroupRadioButton, GroupCheckBox,
-    CustomComboBox, ClickableFigureCanvas
-)
-from .sys_config import OS_CONFIG, PACKAGE_DIR, REPO_DIR
-from .shg_gui import init_gui
-from .gui_html_boxes import (
-    create_crystals_tab, create_visuals_tab, create_point_group_tab, 
-    create_data_help_tab, create_phys_background_tab, create_about_us_tab,
-    create_vers_history, create_license_tab, create_sim_desc, create_fit_desc
-)
-from .gui_layouts import (
-    fit_res_create_layout, fit_inp_create_layout, sim_crystal_remove_layout,
-    sim_key_upload_layout, sim_crystal_add_layout, sim_create_layout,
-    sim_create_crystal_table, main_create_layout, more_window_layout,
-    data_help_layout, point_group_win_layout, visuals_win_layout,
-    crystals_win_layout
-)
-from .check_repo_files import check_files, pull_missing_files
-from .utils import (
-    test_api_key, check_internet_connection, remove_crystal, read_crystal_file,
-    read_data, convert_to_config_str, polar_plot
-)
+import importlib
+
+#Every name is imported from its module on first access (PEP 562), so importing the package loads nothing up front.
+#The gui only pays for what its first window uses and headless tools (shg_fit) never load PyQt6
+_LAZY_ATTRS = {
+    'FitManager': 'data_classes', 'FitConfig': 'data_classes', 'FitInputManager': 'data_classes',
+    'SimInputManager': 'data_classes', 'ChannelData': 'data_classes', 'SimConfig': 'data_classes',
+    'PlotWidget': 'custom_widgets', 'GroupLabel': 'custom_widgets', 'GroupRadioButton': 'custom_widgets',
+    'GroupCheckBox': 'custom_widgets', 'CustomComboBox': 'custom_widgets', 'ClickableFigureCanvas': 'custom_widgets',
+    'OS_CONFIG': 'sys_config', 'PACKAGE_DIR': 'sys_config', 'REPO_DIR': 'sys_config', 'package_version': 'sys_config',
+    'init_gui': 'shg_gui',
+    'create_crystals_tab': 'gui_html_boxes', 'create_visuals_tab': 'gui_html_boxes', 'create_point_group_tab': 'gui_html_boxes',
+    'create_data_help_tab': 'gui_html_boxes', 'create_phys_background_tab': 'gui_html_boxes', 'create_about_us_tab': 'gui_html_boxes',
+    'create_vers_history': 'gui_html_boxes', 'create_license_tab': 'gui_html_boxes', 'create_sim_desc': 'gui_html_boxes',
+    'create_fit_desc': 'gui_html_boxes',
+    'fit_res_create_layout': 'gui_layouts', 'fit_inp_create_layout': 'gui_layouts', 'sim_crystal_remove_layout': 'gui_layouts',
+    'sim_key_upload_layout': 'gui_layouts', 'sim_crystal_add_layout': 'gui_layouts', 'sim_create_layout': 'gui_layouts',
+    'sim_create_crystal_table': 'gui_layouts', 'main_create_layout': 'gui_layouts', 'more_window_layout': 'gui_layouts',
+    'data_help_layout': 'gui_layouts', 'point_group_win_layout': 'gui_layouts', 'visuals_win_layout': 'gui_layouts',
+    'crystals_win_layout': 'gui_layouts',
+    'check_files': 'check_repo_files', 'pull_missing_files': 'check_repo_files',
+    'test_api_key': 'utils', 'check_internet_connection': 'utils', 'remove_crystal': 'utils', 'read_crystal_file': 'utils',
+    'read_data': 'utils', 'load_data': 'utils', 'to_channel_data': 'utils', 'convert_to_config_str': 'utils', 'polar_plot': 'utils',
+    'load_fit_models': 'fit_engine', 'compile_model': 'model_registry', 'fit_point_group': 'fit_engine', 'fit_all_point_groups': 'fit_engine',
+    'ModelRegistry': 'model_registry', 'MODEL_REGISTRY': 'model_registry',
+    'generate_entries': 'model_generator', 'generated_entry': 'model_generator', 'amplitude_guess': 'model_generator',
+    'FitScheduler': 'fit_scheduler', 'FIT_SCHEDULER': 'fit_scheduler',
+    'Worker': 'workers', 'WorkerSignals': 'workers', 'WorkerCancelled': 'workers',
+    'save_session': 'session', 'load_session': 'session', 'load_session_channel': 'session',
+    'LRUCache': 'cache', 'DATA_CACHE': 'cache', 'FIT_CACHE': 'cache',
+    'build_pyramid': 'lod', 'select_level': 'lod', 'scatter_points': 'lod', 'LOD_CACHE': 'lod',
+    'collect_files': 'batch', 'group_files': 'batch', 'build_config': 'batch', 'fit_rows': 'batch', 'write_results': 'batch',
+    'DirectoryWatcher': 'watch', 'RollingWriter': 'watch',
+    'simulate': 'simulation', 'simulate_channels': 'simulation', 'crystal_point_group': 'simulation',
+    'basis_amplitudes': 'simulation',
+    'SweepSpec': 'data_classes', 'SweepStore': 'sweep', 'run_sweep': 'sweep', 'load_sweep_spec': 'sweep', 'open_sweep': 'sweep',
+    'tensor_basis': 'symmetry', 'allowed_sources': 'symmetry', 'normalize_point_group': 'symmetry',
+    'get_reduction': 'symmetry', 'REDUCTION_TABLE': 'symmetry', 'TensorReduction': 'data_classes',
+}
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
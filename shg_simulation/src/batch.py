@@ -0,0 +1,118 @@
+import re
+import glob
+import json
+import pathlib
+import importlib.util
+from typing import List, Dict, Tuple, Union
+
+from .data_classes import FitConfig, PointGroupFit
+from .utils import read_data
+from .simulation import DEFAULT_INCIDENCE
+
+#Channel names a file may carry, mapped onto the names FitConfig uses
+CHANNEL_ALIASES = {'ss': 'SS', 'pp': 'PP', 'sp': 'SP', 'ps': 'PS', 'parallel': 'Parallel', 'par': 'Parallel',
+                   'perpendicular': 'Perpendicular', 'perp': 'Perpendicular'}
+GEOMETRY_CHANNELS = {'refl': ['SS', 'PP', 'SP', 'PS'], 'trans': ['Parallel', 'Perpendicular']}
+#Slot of each channel in FitConfig.data_files, same order as the upload boxes in FittingInput
+DATA_FILE_SLOTS = {'Parallel': 0, 'Perpendicular': 1, 'SS': 2, 'PP': 3, 'SP': 4, 'PS': 5}
+#<sample><separator><channel>.csv, e.g. MoS2_300K_PP.csv
+DEFAULT_FILE_PATTERN = r'(?P<sample>.+?)[_\-. ]+(?P<channel>ss|pp|sp|ps|parallel|perpendicular|par|perp)'
+RESULT_FORMATS = ['csv', 'json', 'parquet']
+
+def collect_files(inputs: List[str], suffix: str='.csv') -> List[pathlib.Path]:
+    #Inputs may be files, directories (every matching file inside) or glob patterns
+    files = []
+    for item in inputs:
+        path = pathlib.Path(item)
+        if path.is_dir():
+            files.extend(sorted(path.glob(f'*{suffix}')))
+        elif path.is_file():
+            files.append(path)
+        else:
+            files.extend(sorted(pathlib.Path(match) for match in glob.glob(item, recursive=True)))
+    unique = []
+    seen = set()
+    for file in files:
+        resolved = file.resolve()
+        if resolved not in seen:
+            seen.add(resolved)
+            unique.append(resolved)
+    return unique
+
+def match_file(file: pathlib.Path, pattern: str=DEFAULT_FILE_PATTERN) -> Union[Tuple[str, str], None]:
+    #(sample, channel) for a data file, None when the name does not follow the pattern
+    match = re.fullmatch(pattern, file.stem, flags=re.IGNORECASE)
+    if match is None:
+        return None
+    channel = CHANNEL_ALIASES.get(match.group('channel').lower())
+    if channel is None:
+        return None
+    return f'{file.parent}/{match.group("sample")}', channel
+
+def group_files(files: List[pathlib.Path], geometry: str,
+                pattern: str=DEFAULT_FILE_PATTERN) -> Dict[str, Dict[str, pathlib.Path]]:
+    #sample -> {channel: file}, files are grouped per directory so samples with the same name never merge
+    groups = {}
+    for file in files:
+        matched = match_file(file, pattern)
+        if matched is None or matched[1] not in GEOMETRY_CHANNELS[geometry]:
+            continue
+        sample, channel = matched
+        groups.setdefault(sample, {})[channel] = file
+    return groups
+
+def build_config(files: Dict[str, pathlib.Path], geometry: str, source: str, sys: str, plane: str,
+                 header: bool=False, fit_mode: str='nonlinear', theta: Union[float, None]=None) -> Union[FitConfig, str]:
+    #Headless counterpart of FittingInput.generate_config, returns the error message on a bad file
+    config = FitConfig(geometry=geometry, source=source, sys=sys, plane=plane, theta=theta, column_headers=header, fit_mode=fit_mode)
+    config.channels = [channel for channel in GEOMETRY_CHANNELS[geometry] if channel in files]
+    if not config.channels:
+        return "No channel files found"
+    for channel in config.channels:
+        data = read_data(data_path=files[channel], header=header, channel=channel)
+        if isinstance(data, str):
+            return f"{data} in {files[channel]} (channel {channel})"
+        config.data[channel] = data
+        config.data_files[DATA_FILE_SLOTS[channel]] = files[channel]
+    return config
+
+def fit_rows(sample: str, config: FitConfig, fits: List[PointGroupFit]) -> List[Dict]:
+    #One row per fit, ranked within each channel, parameters become param_<name> columns
+    rows = []
+    ranks = {}
+    for fit in fits:
+        ranks[fit.channel] = ranks.get(fit.channel, 0) + 1
+        row = {'sample': sample, 'channel': fit.channel, 'point_group': fit.name, 'rank': ranks[fit.channel],
+               'r2': float(fit.r2), 'geometry': config.geometry, 'source': config.source, 'sys': config.sys,
+               'plane': config.plane, 'theta': DEFAULT_INCIDENCE[config.geometry] if config.theta is None else config.theta,
+               'data_file': str(config.data_files[DATA_FILE_SLOTS[fit.channel]])}
+        for name, value in fit.weights:
+            row[f'param_{name}'] = float(value)
+        rows.append(row)
+    return rows
+
+def result_format(file_path: Union[pathlib.Path, str], file_format: Union[str, None]=None) -> str:
+    #Checked before any fitting, so a bad suffix or a missing parquet engine fails a job right away instead of at the end
+    if file_format is None:
+        file_format = pathlib.Path(file_path).suffix.lstrip('.').lower()
+    if file_format not in RESULT_FORMATS:
+        raise ValueError(f"Unsupported results format '{file_format}', use one of: {', '.join(RESULT_FORMATS)}")
+    if file_format == 'parquet' and not any(importlib.util.find_spec(engine) for engine in ['pyarrow', 'fastparquet']):
+        raise ImportError("Writing parquet needs pyarrow or fastparquet installed")
+    return file_format
+
+def write_results(rows: List[Dict], file_path: Union[pathlib.Path, str], file_format: Union[str, None]=None) -> str:
+    file_path = pathlib.Path(file_path)
+    file_format = result_format(file_path, file_format)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    if file_format == 'json':
+        with open(file_path, 'w') as file:
+            json.dump(rows, file, indent=2)
+        return str(file_path)
+    import pandas as pd
+    df = pd.DataFrame(rows)
+    if file_format == 'csv':
+        df.to_csv(file_path, index=False)
+    else:
+        df.to_parquet(file_path, index=False) #Needs pyarrow or fastparquet
+    return str(file_path)
@@ -0,0 +1,207 @@
+import os
+import json
+import uuid
+import pickle
+import hashlib
+import threading
+import pathlib
+import dataclasses
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union, Hashable
+
+from .sys_config import OS_CONFIG, USER_CACHE_DIR
+from .data_classes import ChannelData, PointGroupFit
+
+DISK_EVICT_FRACTION = 0.8
+
+class LRUCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() #key -> (value, nbytes), most recently used last
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock() #Loads happen on worker threads as well as the GUI thread
+
+    def get(self, key: Hashable, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses = self.misses + 1
+                return default
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key: Hashable, value, nbytes: int) -> None:
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes = self.current_bytes - self.entries.pop(key)[1]
+            if nbytes > self.max_bytes: #Never let one oversized entry flush everything else
+                return
+            self.entries[key] = (value, nbytes)
+            self.current_bytes = self.current_bytes + nbytes
+            self.evict()
+
+    def evict(self) -> None:
+        while self.current_bytes > self.max_bytes and self.entries:
+            key, (value, nbytes) = self.entries.popitem(last=False)
+            self.current_bytes = self.current_bytes - nbytes
+            self.evictions = self.evictions + 1
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+class DiskCache:
+    #Directory of pickled entries kept under max_bytes, the least recently used files go first (a hit refreshes the mtime)
+    def __init__(self, directory: Union[pathlib.Path, str], max_bytes: int):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.current_bytes = None #Size of every entry, scanned on the first write
+        self.lock = threading.Lock()
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.directory / f'{key}.pkl'
+
+    def load(self, key: str):
+        #Raises OSError (or an unpickling error) for a missing or damaged entry
+        path = self.path(key)
+        with open(path, 'rb') as file:
+            value = pickle.load(file)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def store(self, key: str, value) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        temp_path = self.directory / f'.{key}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump(value, file)
+        nbytes = temp_path.stat().st_size
+        try:
+            nbytes = nbytes - path.stat().st_size
+        except OSError:
+            pass
+        os.replace(temp_path, path)
+        with self.lock:
+            if self.current_bytes is None:
+                self.current_bytes = sum(size for mtime, size, entry in self.entries())
+            else:
+                self.current_bytes = self.current_bytes + nbytes
+            if self.current_bytes > self.max_bytes:
+                self.evict()
+
+    def entries(self) -> List[Tuple[int, int, pathlib.Path]]:
+        #(mtime_ns, size, path) of every entry, other processes may be writing and evicting the same directory
+        entries = []
+        for path in self.directory.glob('*.pkl'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        #Rescans and trims to DISK_EVICT_FRACTION of the limit, so a full cache is not rescanned on every write
+        entries = sorted(self.entries())
+        self.current_bytes = sum(size for mtime, size, path in entries)
+        target = self.max_bytes * DISK_EVICT_FRACTION
+        for mtime, size, path in entries:
+            if self.current_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.current_bytes = self.current_bytes - size
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        with self.lock:
+            self.max_bytes = max_bytes
+            if self.current_bytes is not None and self.current_bytes > self.max_bytes:
+                self.evict()
+
+def data_cache_key(data_path: Union[pathlib.Path, str], header: bool, dtype: np.dtype) -> Union[Tuple, None]:
+    #The file's mtime and size stand in for its content, any edit to the file produces a new key
+    try:
+        stat = os.stat(data_path)
+    except (OSError, TypeError):
+        return None
+    return (os.path.abspath(data_path), stat.st_mtime_ns, stat.st_size, bool(header), np.dtype(dtype).str)
+
+def channel_nbytes(data: ChannelData) -> int:
+    return sum(array.nbytes for array in [data.phi, data.r, data.sigma] if array is not None)
+
+def freeze_channel(data: ChannelData) -> ChannelData:
+    #Cached arrays are shared between every caller, so they are handed out read-only
+    for array in [data.phi, data.r, data.sigma]:
+        if array is not None:
+            array.flags.writeable = False
+    return data
+
+def array_digest(*arrays: Union[np.ndarray, None]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        if array is None:
+            digest.update(b'none')
+            continue
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+def fit_cache_key(data_digest: str, point_group: str, model_strs: List[str], geometry: str, 
+                  p0: Union[np.ndarray, None]=None) -> str:
+    p0 = None if p0 is None else [float(value) for value in np.ravel(p0)]
+    key = json.dumps([data_digest, point_group, model_strs, geometry, p0])
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+def fit_nbytes(fit: PointGroupFit) -> int:
+    return int(np.asarray(fit.fit_r).nbytes + np.asarray(fit.fit_phi).nbytes) + 256
+
+def get_cached_fit(key: str) -> Union[PointGroupFit, None]:
+    #Memory first, then the optional disk tier, a disk hit is promoted back into memory
+    fit = FIT_CACHE.get(key)
+    if fit is None and OS_CONFIG.fit_disk_cache:
+        try:
+            fit = PointGroupFit(**FIT_DISK_CACHE.load(key))
+            FIT_CACHE.put(key, fit, fit_nbytes(fit))
+        except (OSError, pickle.PickleError, EOFError, TypeError):
+            return None
+    if fit is None:
+        return None
+    return dataclasses.replace(fit) #Callers set legend/active on their copy
+
+def put_cached_fit(key: str, fit: PointGroupFit) -> None:
+    fit = dataclasses.replace(fit, func=None, active=False)
+    FIT_CACHE.put(key, fit, fit_nbytes(fit))
+    if not OS_CONFIG.fit_disk_cache:
+        return
+    fields = {name: getattr(fit, name) for name in ['name', 'channel', 'weights', 'fit_r', 'fit_phi', 'r2']}
+    try:
+        FIT_DISK_CACHE.store(key, fields)
+    except OSError:
+        pass
+
+DATA_CACHE = LRUCache(max_bytes=512 * 1024 ** 2)
+FIT_CACHE = LRUCache(max_bytes=64 * 1024 ** 2)
+#Runtime caches live in the user's cache directory, the installed package may be read only or shared between users
+FIT_CACHE_DIR = f'{USER_CACHE_DIR}/fits'
+FIT_DISK_CACHE = DiskCache(FIT_CACHE_DIR, max_bytes=256 * 1024 ** 2)
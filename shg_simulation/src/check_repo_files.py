@@ -1,7 +1,6 @@
 import pathlib
 import os
 from typing import Union
-import git
 
 from .sys_config import PACKAGE_DIR, REPO_DIR
 
@@ -80,6 +79,7 @@ def check_files() -> Union[bool, str]:
         return message
 
 def pull_missing_files() -> None:
+    import git #Only needed for recovery, importing it also starts a git subprocess check
     git_url = 'https://github.com/jduffy0121/SHG_dev.git'
     repo = git.Repo(REPO_DIR)
     repo.remotes.origin.fetch()
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import argparse
+from typing import List, Union
+
+from .fit_engine import load_fit_models, FIT_MODES
+from .fit_scheduler import FitScheduler
+from .batch import (
+    collect_files, group_files, build_config, fit_rows, write_results, result_format,
+    DEFAULT_FILE_PATTERN, GEOMETRY_CHANNELS, RESULT_FORMATS
+)
+from .watch import DirectoryWatcher, RollingWriter, watch, WATCH_FORMATS
+from .sweep import load_sweep_spec, run_sweep
+from .metrics import METRICS
+
+SYSTEMS = ['Triclinic', 'Monoclinic', 'Orthorhombic', 'Tetragonal', 'Trigonal', 'Hexagonal', 'Cubic']
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='shg_fit', description='Fit RA-SHG channel data to every candidate point group without the gui.')
+    parser.add_argument('inputs', nargs='+', help='channel csv files, directories of them, or glob patterns')
+    parser.add_argument('--geometry', required=True, choices=list(GEOMETRY_CHANNELS))
+    parser.add_argument('--source', required=True, choices=['e_d', 'e_q', 'm_d'])
+    parser.add_argument('--sys', required=True, choices=SYSTEMS)
+    parser.add_argument('--plane', default='001', choices=['001', 'rotz90'])
+    parser.add_argument('--theta', type=float, default=None,
+                        help='angle of incidence in degrees the fit models are built for, defaults to 30 in refl and 0 in trans')
+    parser.add_argument('--header', action='store_true', help='csv files have a column header row')
+    parser.add_argument('--pattern', default=DEFAULT_FILE_PATTERN,
+                        help='regex matched against each file name (no suffix), needs <sample> and <channel> groups')
+    parser.add_argument('-o', '--output', default='shg_fit_results.csv', help='results file (.csv, .json or .parquet)')
+    parser.add_argument('--format', choices=RESULT_FORMATS + WATCH_FORMATS, default=None, help='results format, defaults to the output suffix (jsonl only with --watch)')
+    parser.add_argument('--workers', type=int, default=0, help='fitting processes, 0 uses every core')
+    parser.add_argument('--fit-mode', choices=FIT_MODES, default='nonlinear',
+                        help='linear reads the parameters off one harmonic projection, nonlinear also polishes them by least squares')
+    parser.add_argument('--no-cache', action='store_true', help='refit even if a cached fit exists')
+    parser.add_argument('--shard', type=int, default=0, help='index of this job in a job array')
+    parser.add_argument('--metrics', default=None, metavar='PATH',
+                        help='record load and fit timings and write them on exit (.json, otherwise Prometheus text)')
+    parser.add_argument('--num-shards', type=int, default=1, help='size of the job array, each shard fits every num_shards-th sample')
+    watch_group = parser.add_argument_group('watch mode', 'keep polling the input directories and fit samples as their files land')
+    watch_group.add_argument('--watch', action='store_true', help='watch the input directories (inputs must be directories), results are appended to a .csv or .jsonl output')
+    watch_group.add_argument('--channels', nargs='+', default=None, help='channels a sample needs before it is fit, defaults to every channel of the geometry')
+    watch_group.add_argument('--poll-interval', type=float, default=1.0, help='seconds between directory scans')
+    watch_group.add_argument('--settle-time', type=float, default=2.0, help='seconds a file must stay unchanged before it is read')
+    watch_group.add_argument('--group-timeout', type=float, default=60.0, help='seconds after which an incomplete sample is fit anyway')
+    watch_group.add_argument('--queue-size', type=int, default=4, help='samples waiting to be fit before polling pauses')
+    watch_group.add_argument('--max-idle', type=float, default=0.0, help='stop after this many seconds without a new sample, 0 runs until interrupted')
+    watch_group.add_argument('--max-output-mb', type=float, default=64.0, help='start a new numbered output file past this size')
+    return parser
+
+def run_watch(args: argparse.Namespace) -> int:
+    not_directories = [item for item in args.inputs if not os.path.isdir(item)]
+    if not_directories:
+        print(f"--watch needs existing directories as inputs, not: {', '.join(not_directories)}", file=sys.stderr)
+        return 2
+    try:
+        writer = RollingWriter(args.output, args.format, max_bytes=int(args.max_output_mb * 1024 ** 2))
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    watcher = DirectoryWatcher(args.inputs, args.geometry, pattern=args.pattern, channels=args.channels,
+                               settle_time=args.settle_time, group_timeout=args.group_timeout)
+    scheduler = FitScheduler(max_workers=args.workers or None)
+    print(f"Watching {', '.join(args.inputs)} (Ctrl+C to stop)")
+    try:
+        fitted = watch(watcher, writer, args.source, args.sys, args.plane, header=args.header, fit_mode=args.fit_mode, theta=args.theta, scheduler=scheduler,
+                       use_cache=not args.no_cache, poll_interval=args.poll_interval, queue_size=args.queue_size, max_idle=args.max_idle,
+                       callback=lambda sample, message: print(f"{sample}: {message}", flush=True))
+    except KeyboardInterrupt:
+        return 0
+    except OSError as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        scheduler.shutdown()
+    print(f"Fit {fitted} sample(s)")
+    return 0
+
+def main(argv: Union[List[str], None]=None) -> int:
+    args = create_parser().parse_args(argv)
+    if not 0 <= args.shard < args.num_shards:
+        print(f"Shard {args.shard} is outside a job array of {args.num_shards}", file=sys.stderr)
+        return 2
+    if args.metrics:
+        METRICS.enable(export_path=args.metrics)
+    if args.watch:
+        return run_watch(args)
+    try:
+        result_format(args.output, args.format)
+    except (ValueError, ImportError) as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    files = collect_files(args.inputs)
+    groups = group_files(files, args.geometry, args.pattern)
+    samples = sorted(groups)[args.shard::args.num_shards]
+    if not samples:
+        print("No channel files matched the inputs", file=sys.stderr)
+        return 1
+
+    models = load_fit_models()
+    scheduler = FitScheduler(max_workers=args.workers or None)
+    rows = []
+    failed = 0
+    start = time.perf_counter()
+    try:
+        for i, sample in enumerate(samples):
+            config = build_config(groups[sample], args.geometry, args.source, args.sys, args.plane, args.header, args.fit_mode, args.theta)
+            if isinstance(config, str):
+                print(f"[{i + 1}/{len(samples)}] {sample}: {config}", file=sys.stderr)
+                failed = failed + 1
+                continue
+            fits = scheduler.run(config, models, use_cache=not args.no_cache)
+            rows.extend(fit_rows(sample, config, fits))
+            print(f"[{i + 1}/{len(samples)}] {sample}: {len(fits)} fits over {', '.join(config.channels)}")
+    finally:
+        scheduler.shutdown()
+
+    try:
+        output = write_results(rows, args.output, args.format)
+    except (ValueError, ImportError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(f"Wrote {len(rows)} fits for {len(samples) - failed} sample(s) to {output} in {time.perf_counter() - start:.2f}s")
+    return 1 if failed else 0
+
+def create_sweep_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='shg_sweep', description='Simulate RA-SHG scans over a grid of crystals, tensor elements, angles of incidence and planes.')
+    parser.add_argument('spec', help='sweep settings (.yaml or .json), see the README for the fields')
+    parser.add_argument('-o', '--output', default='shg_sweep', help='directory the chunked results are written to, rerun with the same one to resume')
+    parser.add_argument('--workers', type=int, default=0, help='simulation processes, 0 uses every core')
+    parser.add_argument('--metrics', default=None, metavar='PATH',
+                        help='record simulation timings and write them on exit (.json, otherwise Prometheus text)')
+    return parser
+
+def sweep_main(argv: Union[List[str], None]=None) -> int:
+    args = create_sweep_parser().parse_args(argv)
+    if args.metrics:
+        METRICS.enable(export_path=args.metrics)
+    start = time.perf_counter()
+    progress = {}
+
+    def report(done: int, total: int) -> None:
+        if 'resumed' not in progress:
+            progress['resumed'] = done
+        print(f"[{done}/{total}] chunks", flush=True)
+
+    try:
+        spec = load_sweep_spec(args.spec)
+        store = run_sweep(spec, args.output, max_workers=args.workers or None, callback=report)
+    except (OSError, ValueError, KeyError) as error:
+        print(error, file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print(f"Interrupted, finished chunks are kept in {args.output}, rerun the same command to resume", file=sys.stderr)
+        return 130
+    manifest = store.manifest
+    print(f"Simulated {manifest['total_points']} points x {len(manifest['channels'])} channels into {args.output} "
+          f"({progress.get('resumed', 0)} of {manifest['num_chunks']} chunks resumed) in {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,9 @@ from PyQt6.QtWidgets import (
     QLabel, QCheckBox, QRadioButton
 )
 from PyQt6.QtCore import Qt, pyqtSignal, QRectF
-from PyQt6.QtGui import QPainterPath, QRegion, QColor
+from PyQt6.QtGui import QPainterPath, QRegion, QColor, QPainter, QPen
+
+from .metrics import METRICS
 
 class PlotWidget(QWidget):
     def __init__(self):
@@ -90,16 +92,56 @@ class ComboBoxGroup:
 
 class ClickableFigureCanvas(FigureCanvas):
     canvas_signal = pyqtSignal(int)
-    def __init__(self, figure, plot_id, radius):
+    def __init__(self, figure, plot_id, radius, highlight='ring'):
         super().__init__(figure)
         self.plot_id = plot_id
         self.radius = radius
+        self.highlight = highlight #'ring' paints an outline, 'glow' uses the (much slower) drop shadow effect
         self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
         self.setMouseTracking(True)
         self.canvas_rect = None
         self.glow = None
+        self.selected = False
+        self.background = None
+        self.animated_artists = []
+        self.mpl_connect('draw_event', self.on_draw)
         self.apply_custom_shape()
 
+    def on_draw(self, event):
+        #A full draw renders everything static (grid, data), grab it so animated artists can be blitted over it later
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        for artist in self.animated_artists:
+            self.figure.draw_artist(artist)
+
+    def add_animated(self, artist):
+        artist.set_animated(True)
+        self.animated_artists.append(artist)
+
+    def remove_animated(self, artist):
+        if artist in self.animated_artists:
+            self.animated_artists.remove(artist)
+
+    def blit_animated(self):
+        #Restores the cached background and redraws only the animated artists instead of a full Agg render
+        if self.background is None:
+            self.draw_idle()
+            return
+        with METRICS.timer('canvas_blit_seconds'):
+            self.restore_region(self.background)
+            for artist in self.animated_artists:
+                self.figure.draw_artist(artist)
+            self.blit(self.figure.bbox)
+
+    @METRICS.timed('canvas_paint_seconds') #Includes the Agg render when a full draw is pending
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.selected and self.highlight == 'ring':
+            painter = QPainter(self)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            painter.setPen(QPen(QColor(0, 0, 255, 160), 6))
+            painter.drawEllipse(QRectF(3, 3, self.radius * 2 - 6, self.radius * 2 - 6))
+            painter.end()
+
     def mousePressEvent(self, event):
         self.canvas_signal.emit(self.plot_id) 
         super().mousePressEvent(event)
@@ -114,6 +156,12 @@ class ClickableFigureCanvas(FigureCanvas):
         self.setMask(region)
 
     def apply_glow_effect(self):
+        if self.selected:
+            return
+        self.selected = True
+        if self.highlight == 'ring':
+            self.update()
+            return
         glow_effect = QGraphicsDropShadowEffect(self)
         glow_effect.setBlurRadius(100)
         glow_effect.setColor(QColor(0, 0, 255, 160))  
@@ -121,5 +169,11 @@ class ClickableFigureCanvas(FigureCanvas):
         self.setGraphicsEffect(glow_effect)
 
     def remove_glow_effect(self):
+        if not self.selected:
+            return
+        self.selected = False
+        if self.highlight == 'ring':
+            self.update()
+            return
         self.setGraphicsEffect(None)
         self.glow = None
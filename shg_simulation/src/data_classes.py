@@ -1,7 +1,8 @@
 import types
 import pathlib
+import numpy as np
 from dataclasses import dataclass, field
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union
 from matplotlib import figure, axes
 
 @dataclass
@@ -16,6 +17,61 @@ class PointGroupFit:
     legend: str = ''
     active: bool = False
 
+@dataclass
+class FitModel:
+    point_group: str = ''
+    fit_str: str = ''
+    jac_str: str = ''
+    guess_str: str = ''
+    display_str: str = ''
+    param_names: List[str] = field(default_factory=lambda: [])
+    bounds: List[Tuple[float, float]] = field(default_factory=lambda: []) #(lower, upper) per parameter
+    harmonics: List[int] = field(default_factory=lambda: []) #Orders n of the cos/sin(nφ) terms the model contains
+    func: types.FunctionType = None
+    jac: types.FunctionType = None
+    guess: types.FunctionType = None
+
+@dataclass
+class TrigBasis:
+    phi: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    order: int = 0
+    design: np.ndarray = field(default_factory=lambda: np.zeros((0, 1)))
+    pinv: np.ndarray = None #Pseudo-inverse of design, projecting a scan onto the basis is then one matrix product
+
+@dataclass(slots=True)
+class ChannelData:
+    phi: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    r: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    sigma: Union[np.ndarray, None] = None
+
+@dataclass
+class LODLevel:
+    bins: int = 0
+    phi: np.ndarray = field(default_factory=lambda: np.zeros(0)) #Bin centres
+    count: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    r_min: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    r_max: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    r_mean: np.ndarray = field(default_factory=lambda: np.zeros(0))
+
+@dataclass
+class LODPyramid:
+    levels: List[LODLevel] = field(default_factory=lambda: []) #Coarsest first, each level has twice the bins of the last
+    num_points: int = 0
+
+@dataclass
+class DataLoadResult:
+    data: ChannelData = field(default_factory=lambda: ChannelData())
+    error: str = ''
+
+@dataclass
+class PlotEntry:
+    fig: figure = None
+    canvas: object = None
+    data: ChannelData = None
+    data_color: str = ''
+    scatter: object = None
+    fit_lines: Dict[str, Tuple[PointGroupFit, object]] = field(default_factory=lambda: {})
+
 @dataclass
 class FitManager:
     point_groups: List[PointGroupFit] = field(default_factory=lambda: [])
@@ -31,12 +87,49 @@ class FitManager:
 class FitConfig:
     geometry: str = ''
     channels: List[str] = field(default_factory=lambda: [])
-    data: Dict[str, List[float]] = field(default_factory=lambda: {})
+    data: Dict[str, ChannelData] = field(default_factory=lambda: {})
     data_files: List[pathlib.Path] = field(default_factory=lambda: [None] * 6)
     column_headers: bool = False
     source: str = ''
     sys: str = ''
     plane: str = ''
+    theta: Union[float, None] = None #Angle of incidence in degrees the fit models are built for, None uses the geometry's default
+    session_file: str = ''
+    fit_mode: str = 'nonlinear'
+
+@dataclass
+class TensorReduction:
+    point_group: str = ''
+    source: str = ''
+    rank: int = 3
+    labels: List[str] = field(default_factory=lambda: []) #Independent elements, e.g. ['xxz', 'zxx', 'zzz']
+    #Full tensor (flattened, 3**rank) = coefficients @ independent values, a column per independent element
+    coefficients: np.ndarray = field(default_factory=lambda: np.zeros((27, 0)))
+
+@dataclass
+class SimConfig:
+    point_group: str = ''
+    source: str = 'e_d'
+    geometry: str = 'refl'
+    channels: List[str] = field(default_factory=lambda: [])
+    plane: str = '001'
+    theta: Union[float, None] = None #Angle of incidence in degrees, None uses the geometry's default
+    elements: Dict[str, float] = field(default_factory=lambda: {}) #Independent tensor element -> value, missing ones are 1
+    num_points: int = 720
+
+@dataclass
+class SweepSpec:
+    crystal_files: List[str] = field(default_factory=lambda: []) #Crystal YAML files, empty uses the gui's crystal list
+    crystals: List[str] = field(default_factory=lambda: []) #'Name (Symbol)', name or symbol to keep, empty keeps them all
+    sources: List[str] = field(default_factory=lambda: ['e_d'])
+    geometry: str = 'refl'
+    channels: List[str] = field(default_factory=lambda: []) #Empty simulates every channel of the geometry
+    planes: List[str] = field(default_factory=lambda: ['001'])
+    theta: List[float] = field(default_factory=lambda: []) #Angles of incidence in degrees, empty uses the geometry's default
+    elements: Dict[str, List[float]] = field(default_factory=lambda: {}) #Independent element -> swept values, others stay 1
+    num_points: int = 360 #Azimuths per simulated scan
+    chunk_points: int = 1024 #Grid points per stored chunk
+    dtype: str = 'float64'
 
 @dataclass
 class FitInputManager:
@@ -0,0 +1,76 @@
+import numpy as np
+from typing import List, Union
+
+from .data_classes import PlotEntry, PointGroupFit, ChannelData
+from .utils import plot_fit
+
+class FigureCache:
+    def __init__(self):
+        self.entries = {} #channel -> PlotEntry
+
+    def get(self, channel: str, data: ChannelData) -> Union[PlotEntry, None]:
+        entry = self.entries.get(channel)
+        if entry is not None and entry.data is not data: #Channel was reloaded, the cached figure is stale
+            self.invalidate(channel)
+            return None
+        return entry
+
+    def add(self, channel: str, data: ChannelData, fig, canvas, data_color: str, fits: List[PointGroupFit]) -> PlotEntry:
+        self.invalidate(channel)
+        ax = fig.axes[0]
+        #polar_plot draws the data scatter first then one line per fit, in order
+        entry = PlotEntry(fig=fig, canvas=canvas, data=data, data_color=data_color, scatter=ax.collections[0],
+                          fit_lines={fit.name: (fit, line) for fit, line in zip(fits, ax.lines)})
+        for fit, line in entry.fit_lines.values(): #Fit lines are blitted over the cached grid/data background
+            canvas.add_animated(line)
+        self.entries[channel] = entry
+        return entry
+
+    def sync(self, channel: str, data_color: str, fits: List[PointGroupFit]) -> bool:
+        #Brings the cached artists in line with the current colour/active fits, redraws only if something changed
+        entry = self.entries.get(channel)
+        if entry is None:
+            return False
+        ax = entry.fig.axes[0]
+        static_changed = False
+        lines_changed = False
+        if entry.data_color != data_color:
+            entry.scatter.set_color(data_color)
+            entry.data_color = data_color
+            static_changed = True
+        wanted = {fit.name: fit for fit in fits}
+        for name, (fit, line) in list(entry.fit_lines.items()):
+            if wanted.get(name) is not fit:
+                entry.canvas.remove_animated(line)
+                line.remove()
+                del entry.fit_lines[name]
+                lines_changed = True
+        for name, fit in wanted.items():
+            if name not in entry.fit_lines:
+                line = plot_fit(ax, fit)
+                entry.canvas.add_animated(line)
+                entry.fit_lines[name] = (fit, line)
+                lines_changed = True
+                if np.max(fit.fit_r) > ax.get_rmax(): #Line runs off the current radial scale, axes need a full redraw
+                    ax.relim()
+                    ax.autoscale_view()
+                    static_changed = True
+        if static_changed:
+            entry.canvas.draw_idle()
+        elif lines_changed:
+            entry.canvas.blit_animated()
+        return static_changed or lines_changed
+
+    def invalidate(self, channel: str) -> None:
+        entry = self.entries.pop(channel, None)
+        if entry is not None and entry.canvas is not None:
+            entry.canvas.setParent(None)
+            entry.canvas.deleteLater()
+
+    def detach_all(self) -> None: #Pulls canvases out of the layout that is about to be deleted so they survive
+        for entry in self.entries.values():
+            entry.canvas.setParent(None)
+
+    def clear(self) -> None:
+        for channel in list(self.entries):
+            self.invalidate(channel)
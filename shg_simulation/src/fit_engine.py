@@ -0,0 +1,225 @@
+import pathlib
+import numpy as np
+from typing import List, Tuple, Dict, Union
+
+from .data_classes import FitModel, PointGroupFit, FitConfig, TrigBasis, ChannelData
+from .utils import get_point_groups, to_channel_data
+from .cache import LRUCache, array_digest, fit_cache_key, get_cached_fit, put_cached_fit
+from .metrics import METRICS
+from .model_registry import DEFAULT_FITS_PATH, MODEL_REGISTRY
+
+HARMONIC_ORDER = 6
+NUM_FIT_POINTS = 720
+LEGEND_COLORS = ['Red', 'Green', 'Orange', 'Purple', 'Brown', 'Cyan']
+#linear: parameters come straight from the harmonic projection, nonlinear: that estimate is polished by least squares
+FIT_MODES = ['nonlinear', 'linear']
+BASIS_CACHE = LRUCache(max_bytes=64 * 1024 ** 2)
+
+def model_entry(model: FitModel) -> Dict:
+    #Plain YAML form of a compiled model, used to ship models to worker processes
+    return {'point_group': model.point_group, 'fit': model.fit_str, 'jac': model.jac_str,
+            'guess': model.guess_str, 'display_str': model.display_str,
+            'bounds': {name: list(bound) for name, bound in zip(model.param_names, model.bounds)},
+            'harmonics': list(model.harmonics)}
+
+def load_fit_models(file_path: pathlib.Path=DEFAULT_FITS_PATH) -> Dict[str, FitModel]:
+    #Parsed and compiled once per file version, see model_registry
+    return MODEL_REGISTRY.load(file_path)
+
+def channel_arrays(data: ChannelData) -> Tuple[np.ndarray, np.ndarray, Union[np.ndarray, None]]:
+    #Views of the stored arrays, only float32 channels get copied up to float64 for the optimizer
+    data = to_channel_data(data)
+    sigma = None if data.sigma is None else np.asarray(data.sigma, dtype=np.float64)
+    return np.asarray(data.phi, dtype=np.float64), np.asarray(data.r, dtype=np.float64), sigma
+
+def trig_basis(phi: np.ndarray, order: int=HARMONIC_ORDER) -> TrigBasis:
+    #Design matrix columns: 1, cos(φ)..cos(nφ), sin(φ)..sin(nφ), built with the angle-addition recurrence
+    cos = np.empty((order + 1, phi.size))
+    sin = np.empty((order + 1, phi.size))
+    cos[0], sin[0] = 1.0, 0.0
+    if order >= 1:
+        cos[1], sin[1] = np.cos(phi), np.sin(phi)
+    for n in range(2, order + 1):
+        cos[n] = 2 * cos[1] * cos[n-1] - cos[n-2]
+        sin[n] = 2 * cos[1] * sin[n-1] - sin[n-2]
+    return TrigBasis(phi=phi, order=order, design=np.ascontiguousarray(np.vstack([cos, sin[1:]]).T))
+
+def get_trig_basis(phi: np.ndarray, order: int=HARMONIC_ORDER) -> TrigBasis:
+    #Channels of a scan share their angles, so the design matrix and its pseudo-inverse are kept per angle grid
+    key = (array_digest(phi), order)
+    basis = BASIS_CACHE.get(key)
+    if basis is None:
+        basis = trig_basis(phi, order)
+        if 2 * basis.design.nbytes > BASIS_CACHE.max_bytes: #Too large to keep, a single lstsq is cheaper than a pinv
+            return basis
+        basis.pinv = np.linalg.pinv(basis.design)
+        BASIS_CACHE.put(key, basis, basis.design.nbytes + basis.pinv.nbytes)
+    return basis
+
+def harmonic_coefficients(phi: np.ndarray, r: np.ndarray, order: int=HARMONIC_ORDER, 
+                          basis: Union[TrigBasis, None]=None, sigma: Union[np.ndarray, None]=None) -> np.ndarray:
+    #Complex coefficients h[n] such that r ≈ Re(sum(h[n] * exp(i*n*phi)))
+    if basis is None:
+        basis = get_trig_basis(phi, order)
+    if sigma is not None: #Weighted projection, the rows are rescaled so the cached pseudo-inverse doesn't apply
+        coeffs = np.linalg.lstsq(basis.design / sigma[:, None], r / sigma, rcond=None)[0]
+    elif basis.pinv is not None:
+        coeffs = basis.pinv @ r
+    else:
+        coeffs = np.linalg.lstsq(basis.design, r, rcond=None)[0]
+    h = coeffs[:basis.order + 1].astype(np.complex128)
+    h[1:] = h[1:] - 1j * coeffs[basis.order + 1:]
+    return h
+
+def resolves_harmonics(phi: np.ndarray, order: int) -> bool:
+    #A partial rotation leaves the harmonic projection ill-conditioned, every gap in the scan has to be under half a period
+    if phi.size == 0:
+        return False
+    wrapped = np.sort(np.mod(phi, 2 * np.pi))
+    largest_gap = max(float(np.max(np.diff(wrapped), initial=0.0)), float(wrapped[0] + 2 * np.pi - wrapped[-1]))
+    return largest_gap < np.pi / max(order, 1)
+
+def linear_estimate(model: FitModel, h: np.ndarray) -> Union[np.ndarray, None]:
+    #Parameters recovered from the harmonics by the model's guess, None when the model can't be read off the basis
+    if model.guess is None or any(n > len(h) - 1 for n in model.harmonics):
+        return None
+    p0 = np.asarray(model.guess(h), dtype=np.float64)
+    if p0.shape == (len(model.param_names),) and np.all(np.isfinite(p0)):
+        return p0
+    return None
+
+def initial_guess(model: FitModel, h: np.ndarray, r: np.ndarray) -> np.ndarray:
+    p0 = linear_estimate(model, h)
+    if p0 is not None:
+        return p0
+    p0 = np.ones(len(model.param_names))
+    if len(p0) > 0:
+        p0[0] = np.max(np.abs(r))
+    return p0
+
+def model_jacobian(model: FitModel, phi: np.ndarray, params: np.ndarray, 
+                   sigma: Union[np.ndarray, None]=None) -> np.ndarray:
+    columns = model.jac(phi, *params)
+    jac = np.column_stack([np.broadcast_to(column, phi.shape) for column in columns])
+    if sigma is not None:
+        jac = jac / sigma[:, None]
+    return jac
+
+def bounds_arrays(model: FitModel, num_params: int) -> Tuple[np.ndarray, np.ndarray]:
+    bounds = np.full((num_params, 2), [-np.inf, np.inf])
+    if model.bounds:
+        bounds[:len(model.bounds)] = model.bounds
+    return bounds[:, 0], bounds[:, 1]
+
+def r_squared(residuals: np.ndarray, r: np.ndarray) -> float:
+    ss_res = np.dot(residuals, residuals)
+    ss_tot = np.dot(r - r.mean(), r - r.mean())
+    if ss_tot == 0:
+        return 1.0 if ss_res == 0 else 0.0
+    return float(1 - ss_res / ss_tot)
+
+@METRICS.timed('fit_seconds')
+def fit_point_group(model: FitModel, phi: np.ndarray, r: np.ndarray, channel: str='',
+                    p0: Union[np.ndarray, None]=None, h: Union[np.ndarray, None]=None,
+                    sigma: Union[np.ndarray, None]=None, mode: str='nonlinear') -> PointGroupFit:
+    phi = np.ascontiguousarray(phi, dtype=np.float64)
+    r = np.ascontiguousarray(r, dtype=np.float64)
+    if h is None and (p0 is None or mode == 'linear'):
+        h = harmonic_coefficients(phi, r, sigma=sigma)
+    if h is not None and max(model.harmonics, default=0) > len(h) - 1: #Quadrupole intensities reach 8φ, past the shared projection
+        h = harmonic_coefficients(phi, r, order=max(model.harmonics), sigma=sigma)
+    params = None
+    if mode == 'linear' and p0 is None and resolves_harmonics(phi, max(model.harmonics, default=HARMONIC_ORDER)):
+        params = linear_estimate(model, h)
+    if params is not None:
+        lower, upper = bounds_arrays(model, len(params))
+        params = np.clip(params, lower, upper)
+        fun = model.func(phi, *params) - r
+    else:
+        if mode == 'linear': #No closed form for this model, it falls back to the optimizer
+            METRICS.count('fits_linear_fallback')
+        if p0 is None:
+            p0 = initial_guess(model, h, r)
+        params, fun = refine(model, phi, r, p0, sigma)
+
+    fit_phi = np.linspace(0, 2 * np.pi, NUM_FIT_POINTS)
+    return PointGroupFit(name=model.point_group, channel=channel, func=model.func,
+                         weights=[(name, float(value)) for name, value in zip(model.param_names, params)],
+                         fit_r=model.func(fit_phi, *params) * np.ones_like(fit_phi), fit_phi=fit_phi,
+                         r2=r_squared(fun * np.ones_like(r), r))
+
+def refine(model: FitModel, phi: np.ndarray, r: np.ndarray, p0: np.ndarray,
+           sigma: Union[np.ndarray, None]=None) -> Tuple[np.ndarray, np.ndarray]:
+    #Nonlinear least squares from p0, returns the parameters and the unweighted residuals
+    from scipy.optimize import least_squares #Deferred so opening the gui does not wait on scipy
+
+    if len(p0) == 0: #Channels a group forbids have nothing to optimize
+        return p0, model.func(phi) * np.ones_like(r) - r
+    def residuals(params):
+        if sigma is not None: #Channels with per-point uncertainties are fit by weighted least squares
+            return (model.func(phi, *params) - r) / sigma
+        return model.func(phi, *params) - r
+
+    if model.jac is not None:
+        jac = lambda params: model_jacobian(model, phi, params, sigma)
+    else:
+        jac = '2-point'
+    lower, upper = bounds_arrays(model, len(p0))
+    if np.all(np.isinf(lower)) and np.all(np.isinf(upper)):
+        result = least_squares(residuals, p0, jac=jac, method='lm' if len(r) >= len(p0) else 'trf')
+    else: #Levenberg-Marquardt can't take bounds, the starting point has to lie strictly inside them for trf
+        p0 = np.clip(p0, np.nextafter(lower, np.inf), np.nextafter(upper, -np.inf))
+        result = least_squares(residuals, p0, jac=jac, method='trf', bounds=(lower, upper))
+    return result.x, (result.fun if sigma is None else result.fun * sigma)
+
+def fit_key(model: FitModel, data_digest: str, geometry: str, p0: Union[np.ndarray, None]=None,
+            mode: str='nonlinear') -> str:
+    return fit_cache_key(data_digest, model.point_group, [model.fit_str, model.jac_str, model.guess_str, str(model.bounds), mode],
+                         geometry, p0)
+
+def lookup_fit(model: FitModel, key: str, channel: str) -> Union[PointGroupFit, None]:
+    fit = get_cached_fit(key)
+    if fit is not None:
+        fit.func = model.func
+        fit.channel = channel
+    return fit
+
+def channel_models(config: FitConfig, channel: str, models: Dict[str, FitModel]) -> Dict[str, FitModel]:
+    #Models generated from the symmetry reduced tensors for this channel, hand-written models in the fits file take precedence
+    generated = MODEL_REGISTRY.load_generated(config.source, config.geometry, channel, config.plane, config.theta)
+    return {**generated, **models}
+
+def candidate_point_groups(config: FitConfig, models: Dict[str, FitModel]) -> List[str]:
+    return [name for name in get_point_groups(config.source, config.sys) if name in models]
+
+def count_fits(config: FitConfig, models: Dict[str, FitModel]) -> int:
+    return sum(len(candidate_point_groups(config, channel_models(config, channel, models))) for channel in config.channels)
+
+def legend_color(point_groups: List[str], name: str) -> str:
+    return LEGEND_COLORS[point_groups.index(name) % len(LEGEND_COLORS)]
+
+def rank_fits(fits: List[PointGroupFit]) -> List[PointGroupFit]:
+    return sorted(fits, key=lambda fit: fit.r2, reverse=True)
+
+def fit_all_point_groups(config: FitConfig, models: Union[Dict[str, FitModel], None]=None, 
+                         use_cache: bool=True) -> List[PointGroupFit]:
+    if models is None:
+        models = load_fit_models()
+    point_groups = get_point_groups(config.source, config.sys) #Legend colors follow the system's list in every channel
+    fits = []
+    for channel in config.channels:
+        #The trig basis and harmonic projection only depend on the channel, so every model shares them
+        phi, r, sigma = channel_arrays(config.data[channel])
+        h = harmonic_coefficients(phi, r, sigma=sigma)
+        data_digest = array_digest(phi, r, sigma)
+        models_for_channel = channel_models(config, channel, models)
+        for point_group in candidate_point_groups(config, models_for_channel):
+            model = models_for_channel[point_group]
+            key = fit_key(model, data_digest, config.geometry, mode=config.fit_mode)
+            fit = lookup_fit(model, key, channel) if use_cache else None
+            if fit is None:
+                fit = fit_point_group(model, phi, r, channel=channel, h=h, sigma=sigma, mode=config.fit_mode)
+                put_cached_fit(key, fit)
+            fit.legend = legend_color(point_groups, point_group)
+            fits.append(fit)
+    return rank_fits(fits)
@@ -0,0 +1,119 @@
+import os
+import atexit
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Union, Callable, Iterator
+
+from .sys_config import OS_CONFIG
+from .data_classes import FitConfig, FitModel, PointGroupFit
+from .fit_engine import (
+    load_fit_models, model_entry, channel_arrays, harmonic_coefficients,
+    fit_point_group, channel_models, candidate_point_groups, legend_color, rank_fits, fit_key, lookup_fit
+)
+from .model_registry import compile_model
+from .utils import get_point_groups
+from .cache import array_digest, put_cached_fit
+from .metrics import METRICS
+
+_WORKER_MODELS = {} #Compiled models cached inside each worker process, keyed by point group, fit string and bounds
+
+def worker_model(entry: Dict) -> FitModel:
+    #Model rebuilt from model_entry inside a worker, it has to behave exactly like the parent's
+    key = (entry['point_group'], entry['fit'], str(entry.get('bounds'))) #Groups can share an expression in a channel
+    if key not in _WORKER_MODELS:
+        _WORKER_MODELS[key] = compile_model(entry)
+        _WORKER_MODELS[key].harmonics = entry['harmonics'] #Detected in the parent, it decides the guess's projection order
+    return _WORKER_MODELS[key]
+
+def _fit_job(entry: Dict, phi: np.ndarray, r: np.ndarray, channel: str, h: np.ndarray,
+             sigma: Union[np.ndarray, None], mode: str='nonlinear') -> PointGroupFit:
+    fit = fit_point_group(worker_model(entry), phi, r, channel=channel, h=h, sigma=sigma, mode=mode)
+    fit.func = None #Eval'd lambdas can't be pickled back to the parent process
+    return fit
+
+class FitScheduler:
+    def __init__(self, max_workers: Union[int, None]=None):
+        self.max_workers = max_workers
+        self.executor = None
+
+    def worker_count(self) -> int:
+        workers = self.max_workers or OS_CONFIG.fit_max_workers or os.cpu_count() or 1
+        return max(1, int(workers))
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None: #Pool is started once and reused, spawning workers per run costs more than most fits
+            #Spawned workers start from a clean interpreter, forking the gui process would copy Qt's threads and locks
+            self.executor = ProcessPoolExecutor(max_workers=self.worker_count(), mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def create_jobs(self, config: FitConfig, models: Dict[str, FitModel]) -> List[Tuple]:
+        jobs = []
+        for channel in config.channels:
+            phi, r, sigma = channel_arrays(config.data[channel])
+            h = harmonic_coefficients(phi, r, sigma=sigma)
+            data_digest = array_digest(phi, r, sigma)
+            models_for_channel = channel_models(config, channel, models)
+            for point_group in candidate_point_groups(config, models_for_channel):
+                model = models_for_channel[point_group]
+                key = fit_key(model, data_digest, config.geometry, mode=config.fit_mode)
+                jobs.append((channel, model, phi, r, h, sigma, key))
+        return jobs
+
+    def iter_fits(self, config: FitConfig, models: Union[Dict[str, FitModel], None]=None,
+                  use_cache: bool=True) -> Iterator[Tuple[int, PointGroupFit]]:
+        #Yields (job index, fit) in completion order, job index follows config.channels x candidate point groups
+        if models is None:
+            models = load_fit_models()
+        point_groups = get_point_groups(config.source, config.sys)
+        jobs = self.create_jobs(config, models)
+        cached = {}
+        if use_cache: #Fits already in the memory/disk cache never reach the optimizer
+            for i, (channel, model, phi, r, h, sigma, key) in enumerate(jobs):
+                fit = lookup_fit(model, key, channel)
+                if fit is not None:
+                    cached[i] = fit
+        pending = [(i, job) for i, job in enumerate(jobs) if i not in cached]
+        METRICS.count('fits_cached', len(cached))
+        METRICS.count('fits_computed', len(pending))
+        futures = {}
+        #Linear fits take microseconds, shipping the scans to the pool would cost more than fitting them here
+        if len(pending) <= 1 or self.worker_count() == 1 or config.fit_mode == 'linear':
+            results = ((i, fit_point_group(model, phi, r, channel=channel, h=h, sigma=sigma, mode=config.fit_mode))
+                       for i, (channel, model, phi, r, h, sigma, key) in pending)
+        else:
+            executor = self.get_executor()
+            futures = {executor.submit(_fit_job, model_entry(model), phi, r, channel, h, sigma, config.fit_mode): i
+                       for i, (channel, model, phi, r, h, sigma, key) in pending}
+            results = ((futures[future], future.result()) for future in as_completed(futures))
+        try:
+            for i, fit in cached.items():
+                fit.legend = legend_color(point_groups, fit.name)
+                yield i, fit
+            for i, fit in results:
+                fit.func = jobs[i][1].func
+                put_cached_fit(jobs[i][6], fit)
+                fit.legend = legend_color(point_groups, fit.name)
+                yield i, fit
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def run(self, config: FitConfig, models: Union[Dict[str, FitModel], None]=None,
+            callback: Union[Callable[[PointGroupFit], None], None]=None, use_cache: bool=True) -> List[PointGroupFit]:
+        fits = {}
+        with METRICS.timer('fit_run_seconds'):
+            for i, fit in self.iter_fits(config, models, use_cache):
+                fits[i] = fit
+                if callback is not None:
+                    callback(fit)
+        #Results are put back in job order before ranking so ties always come out the same way
+        return rank_fits([fits[i] for i in sorted(fits)])
+
+FIT_SCHEDULER = FitScheduler()
+atexit.register(FIT_SCHEDULER.shutdown)
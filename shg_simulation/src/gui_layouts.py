@@ -1,5 +1,4 @@
 import pathlib
-import pkg_resources
 from typing import List
 from PyQt6.QtCore import Qt 
 from PyQt6.QtWidgets import (
@@ -9,9 +8,9 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QFontMetrics, QTextOption, QPixmap
 
-from .sys_config import OS_CONFIG, PACKAGE_DIR, REPO_DIR
+from .sys_config import OS_CONFIG, PACKAGE_DIR, REPO_DIR, package_version
 from .data_classes import FitManager, FitConfig
-from .custom_widgets import GroupLabel, GroupRadioButton, GroupCheckBox, CustomComboBox
+from .custom_widgets import GroupLabel, GroupRadioButton, GroupCheckBox, CustomComboBox, TableCheckBox, TableLabel
 from .gui_html_boxes import (
     create_crystals_tab, create_visuals_tab, create_point_group_tab, create_data_help_tab,
     create_phys_background_tab, create_about_us_tab, create_vers_history,
@@ -59,6 +58,29 @@ def fit_res_create_table():
     group_box.setFixedSize(525, 550)
     return group_box
 
+def fit_res_fill_table(table, point_groups) -> QButtonGroup:
+    table.setRowCount(0)
+    check_button_group = QButtonGroup()
+    check_button_group.setExclusive(False)
+    for row, point_group in enumerate(point_groups):
+        check_box = fit_res_add_table_row(table, point_group)
+        check_button_group.addButton(check_box)
+        check_button_group.setId(check_box, row)
+    return check_button_group
+
+def fit_res_add_table_row(table, point_group) -> TableCheckBox:
+    row = table.rowCount()
+    table.insertRow(row)
+    check_box = TableCheckBox('')
+    check_box.setChecked(point_group.active)
+    params = ', '.join(f'{name} = {value:.4g}' for name, value in point_group.weights)
+    table.setCellWidget(row, 0, check_box)
+    table.setCellWidget(row, 1, TableLabel(f'{point_group.name} ({point_group.channel})'))
+    table.setCellWidget(row, 2, TableLabel(f'R² = {point_group.r2:.4f}'))
+    table.setCellWidget(row, 3, TableLabel(f'<span style="color: {point_group.legend.lower()};">━</span> {point_group.legend}'))
+    table.setCellWidget(row, 4, TableLabel(params))
+    return check_box
+
 def fit_res_create_expand_win(config):
     layout = QStackedLayout()
     layout_1 = QVBoxLayout()
@@ -544,6 +566,41 @@ def sim_create_crystal_table() -> QStackedLayout:
 
     return layout
 
+def sim_res_create_layout(title: str, sources: List[str]) -> QGridLayout:
+    layout = QGridLayout()
+    options_layout = QHBoxLayout()
+
+    header_label = QLabel(f"<h1>{title}</h1>") 
+    img_label = QLabel()
+    img = QPixmap(f'{PACKAGE_DIR}/imgs/logo_mini.png')
+    img_scaled = img.scaled(136,68)
+    img_label.setPixmap(img_scaled)
+    layout.addWidget(img_label, 0, 0, alignment=Qt.AlignmentFlag.AlignLeft)
+    layout.addWidget(header_label, 0, 1, alignment=Qt.AlignmentFlag.AlignCenter)
+
+    source_label = GroupLabel('Choose source')
+    source_box = CustomComboBox()
+    source_box.addItems(sources)
+    plane_label = GroupLabel('Choose plane')
+    plane_box = CustomComboBox()
+    plane_box.addItems(['(0 0 1)', 'Rotz(90°)'])
+    options_layout.addWidget(source_label)
+    options_layout.addWidget(source_box)
+    options_layout.addWidget(plane_label)
+    options_layout.addWidget(plane_box)
+    layout.addLayout(options_layout, 1, 0, 1, 2, alignment=Qt.AlignmentFlag.AlignCenter)
+
+    #Reflection channels on the first row, transmission on the second, filled in by SimSearchResults
+    group_box = QGroupBox()
+    group_box.setLayout(QGridLayout())
+    layout.addWidget(group_box, 2, 0, 1, 2, alignment=Qt.AlignmentFlag.AlignCenter)
+
+    back_button = QPushButton("Back")
+    back_button.setFixedSize(70,22)
+    layout.addWidget(back_button, 3, 0, alignment=Qt.AlignmentFlag.AlignLeft)
+
+    return layout
+
 def main_create_layout() -> QVBoxLayout:
     layout = QVBoxLayout()
     sub_layout = QGridLayout()
@@ -556,7 +613,7 @@ def main_create_layout() -> QVBoxLayout:
     layout.addWidget(img_label)
     
     package_label = GroupLabel(f'<h1>SHG_Package_Name</h1>')
-    vers_label = GroupLabel(f'<i><font size="-1">Version:{pkg_resources.get_distribution("shg_simulation").version}</font></i><br>')
+    vers_label = GroupLabel(f'<i><font size="-1">Version:{package_version()}</font></i><br>')
     sub_layout.addWidget(package_label, 0, 0, 1, 2, alignment=Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignTop)
     sub_layout.addWidget(vers_label, 1, 0, 1, 2, alignment=Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignTop)
 
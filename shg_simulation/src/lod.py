@@ -0,0 +1,98 @@
+import numpy as np
+from typing import Tuple, Union
+
+from .data_classes import ChannelData, LODLevel, LODPyramid
+from .cache import LRUCache
+
+LOD_MIN_BINS = 64
+LOD_MAX_BINS = 2 ** 16
+LOD_BINS_PER_PIXEL = 2 #Angular bins per pixel of plot circumference
+LOD_CACHE = LRUCache(max_bytes=128 * 1024 ** 2)
+
+def _bin_mean(r_sum: np.ndarray, count: np.ndarray) -> np.ndarray:
+    return np.divide(r_sum, count, out=np.zeros(r_sum.size), where=count > 0)
+
+def _finest_level(phi: np.ndarray, r: np.ndarray, bins: int) -> LODLevel:
+    lo, hi = float(phi.min()), float(phi.max())
+    span = hi - lo if hi > lo else 1.0
+    index = ((phi - lo) * (bins / span)).astype(np.intp)
+    np.clip(index, 0, bins - 1, out=index)
+    if np.any(index[1:] < index[:-1]): #Scans are normally in angle order, only sort when they are not
+        order = np.argsort(index, kind='stable')
+        index, r = index[order], r[order]
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    occupied = index[starts]
+    count = np.zeros(bins, dtype=np.int64)
+    count[occupied] = np.diff(np.r_[starts, index.size])
+    r_min = np.full(bins, np.inf)
+    r_min[occupied] = np.minimum.reduceat(r, starts)
+    r_max = np.full(bins, -np.inf)
+    r_max[occupied] = np.maximum.reduceat(r, starts)
+    r_sum = np.zeros(bins)
+    r_sum[occupied] = np.add.reduceat(r, starts)
+    centres = lo + (np.arange(bins) + 0.5) * (span / bins)
+    return LODLevel(bins=bins, phi=centres, count=count, r_min=r_min, r_max=r_max, r_mean=_bin_mean(r_sum, count))
+
+def _coarsen(level: LODLevel) -> LODLevel:
+    #Merges neighbouring bin pairs, the statistics combine exactly so no level ever rereads the raw data
+    count = level.count.reshape(-1, 2).sum(axis=1)
+    r_sum = (level.r_mean * level.count).reshape(-1, 2).sum(axis=1)
+    return LODLevel(bins=level.bins // 2, phi=level.phi.reshape(-1, 2).mean(axis=1), count=count,
+                    r_min=level.r_min.reshape(-1, 2).min(axis=1), r_max=level.r_max.reshape(-1, 2).max(axis=1),
+                    r_mean=_bin_mean(r_sum, count))
+
+def build_pyramid(data: ChannelData) -> LODPyramid:
+    phi = np.asarray(data.phi, dtype=np.float64)
+    r = np.asarray(data.r, dtype=np.float64)
+    if phi.size == 0:
+        return LODPyramid()
+    #Finest level keeps about three points per bin, anything finer is no cheaper than the raw scan
+    bins = int(2 ** np.ceil(np.log2(max(phi.size // 3, LOD_MIN_BINS))))
+    levels = [_finest_level(phi, r, min(bins, LOD_MAX_BINS))]
+    while levels[-1].bins > LOD_MIN_BINS:
+        levels.append(_coarsen(levels[-1]))
+    return LODPyramid(levels=levels[::-1], num_points=int(phi.size))
+
+def get_pyramid(data: ChannelData) -> LODPyramid:
+    #Keyed on the array identities, the entry holds the arrays so those ids can not be reused while it is cached
+    key = (id(data.phi), id(data.r))
+    entry = LOD_CACHE.get(key)
+    if entry is not None:
+        return entry[2]
+    pyramid = build_pyramid(data)
+    nbytes = sum(level.bins * 48 for level in pyramid.levels)
+    LOD_CACHE.put(key, (data.phi, data.r, pyramid), nbytes)
+    return pyramid
+
+def select_level(data: ChannelData, pixels: Union[float, None]) -> Union[LODLevel, None]:
+    #Coarsest level that still gives every pixel around the plot circumference its own bins, None means draw the raw data
+    if pixels is None:
+        return None
+    needed = np.pi * pixels * LOD_BINS_PER_PIXEL
+    if np.asarray(data.r).size <= 3 * needed:
+        return None
+    pyramid = get_pyramid(data)
+    for level in pyramid.levels:
+        if level.bins >= needed:
+            if 3 * np.count_nonzero(level.count) >= pyramid.num_points:
+                return None
+            return level
+    return None
+
+def level_points(level: LODLevel) -> Tuple[np.ndarray, np.ndarray]:
+    #Min, mean and max of each occupied bin, drawn at the bin centre, keeps the envelope and the trend of the scan
+    occupied = level.count > 0
+    phi = level.phi[occupied]
+    return (np.concatenate([phi, phi, phi]),
+            np.concatenate([level.r_min[occupied], level.r_mean[occupied], level.r_max[occupied]]))
+
+def scatter_points(data: ChannelData, pixels: Union[float, None]=None,
+                   r_range: Union[Tuple[float, float], None]=None) -> Tuple[np.ndarray, np.ndarray]:
+    level = select_level(data, pixels)
+    if level is not None:
+        return level_points(level)
+    phi, r = np.asarray(data.phi), np.asarray(data.r)
+    if r_range is not None: #Zoomed in, only the points inside the visible radial range are drawn
+        visible = (r >= r_range[0]) & (r <= r_range[1])
+        phi, r = phi[visible], r[visible]
+    return phi, r
@@ -0,0 +1,180 @@
+import json
+import time
+import atexit
+import bisect
+import pathlib
+import functools
+import threading
+from typing import List, Dict, Union, Callable
+
+#Latency buckets in seconds, from sub-millisecond blits up to multi-second fit runs
+DEFAULT_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+METRICS_PREFIX = 'shg'
+
+class Counter:
+    def __init__(self, name: str, description: str=''):
+        self.name = name
+        self.description = description
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float=1.0) -> None:
+        with self.lock:
+            self.value = self.value + amount
+
+    def snapshot(self) -> Dict:
+        return {'type': 'counter', 'description': self.description, 'value': self.value}
+
+class Histogram:
+    def __init__(self, name: str, description: str='', buckets: Union[List[float], None]=None):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1) #Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] = self.counts[index] + 1
+            self.sum = self.sum + value
+            self.count = self.count + 1
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {'type': 'histogram', 'description': self.description, 'count': self.count, 'sum': self.sum,
+                    'mean': self.sum / self.count if self.count else 0.0, 'min': self.min if self.count else 0.0,
+                    'max': self.max if self.count else 0.0,
+                    'buckets': {str(bound): count for bound, count in zip(self.buckets + ['+Inf'], self.counts)}}
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    #Shared no-op handed out while metrics are disabled, so a disabled timer is one attribute check
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool=False):
+        self.enabled = enabled
+        self.metrics = {} #name -> Counter or Histogram
+        self.lock = threading.Lock()
+        self.export_path = None
+
+    def enable(self, export_path: Union[pathlib.Path, str, None]=None) -> None:
+        #With an export path the metrics are written when the process exits
+        self.enabled = True
+        if export_path is not None and self.export_path is None:
+            atexit.register(self.export_at_exit)
+        if export_path is not None:
+            self.export_path = export_path
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self.lock:
+            self.metrics.clear()
+
+    def _get(self, name: str, metric_type, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(name, metric_type(name, **kwargs))
+        return metric
+
+    def counter(self, name: str, description: str='') -> Counter:
+        return self._get(name, Counter, description=description)
+
+    def histogram(self, name: str, description: str='', buckets: Union[List[float], None]=None) -> Histogram:
+        return self._get(name, Histogram, description=description, buckets=buckets)
+
+    def count(self, name: str, amount: float=1.0) -> None:
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def observe(self, name: str, value: float) -> None:
+        if self.enabled:
+            self.histogram(name).observe(value)
+
+    def timer(self, name: str):
+        #with METRICS.timer('fit_seconds'): ...
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(name))
+
+    def timed(self, name: str) -> Callable:
+        #Decorator form of timer, the wrapped function is called straight through while disabled
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self.histogram(name)):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self.lock:
+            metrics = dict(self.metrics)
+        return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, snapshot in self.snapshot().items():
+            full_name = f'{METRICS_PREFIX}_{name}'
+            if snapshot['type'] == 'counter': #HELP, TYPE and the sample have to share the name for parsers to match them
+                full_name = f'{full_name}_total'
+            if snapshot['description']:
+                lines.append(f'# HELP {full_name} {snapshot["description"]}')
+            if snapshot['type'] == 'counter':
+                lines.append(f'# TYPE {full_name} counter')
+                lines.append(f'{full_name} {snapshot["value"]}')
+                continue
+            lines.append(f'# TYPE {full_name} histogram')
+            cumulative = 0
+            for bound, count in snapshot['buckets'].items(): #Prometheus buckets are cumulative
+                cumulative = cumulative + count
+                lines.append(f'{full_name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{full_name}_sum {snapshot["sum"]}')
+            lines.append(f'{full_name}_count {snapshot["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_path: Union[pathlib.Path, str]) -> str:
+        #.json writes the snapshot, anything else (.prom, .txt) the Prometheus text format
+        file_path = pathlib.Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, 'w') as file:
+            if file_path.suffix.lower() == '.json':
+                json.dump(self.snapshot(), file, indent=2)
+            else:
+                file.write(self.to_prometheus())
+        return str(file_path)
+
+    def export_at_exit(self) -> None:
+        if self.export_path is not None and self.metrics:
+            self.export(self.export_path)
+
+METRICS = MetricsRegistry()
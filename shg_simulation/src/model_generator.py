@@ -0,0 +1,175 @@
+import numpy as np
+from typing import List, Tuple, Dict, Union
+
+from .symmetry import POINT_GROUP_GENERATORS, get_reduction, tensor_basis, definitions_digest
+from .simulation import (
+    CHANNEL_POLARIZATIONS, DEFAULT_INCIDENCE, PLANE_ROTATIONS, field_weights, rotated_tensors, rotation_stack
+)
+
+#The SHG amplitude of a rank n tensor rotated about z only holds harmonics up to nφ, so a handful of samples fixes it exactly
+GENERATOR_POINTS = 16
+GENERATOR_VERSION = 2
+COEFFICIENT_TOL = 1e-10
+RANK_TOL = 1e-8
+GUESS_TOL = 1e-4 #Top intensity harmonics below this fraction of the mean are taken as noise by amplitude_guess
+
+def amplitude_harmonics(point_group: str, source: str, geometry: str, channel: str, plane: str='001',
+                        theta: Union[float, None]=None) -> Tuple[np.ndarray, np.ndarray, Tuple[str, ...]]:
+    #cos and sin coefficients (M, rank + 1) of the amplitude each independent element gives on its own, with the element labels.
+    #The channel amplitude is linear in the elements, A(φ) = Σ_m χ_m Σ_n (cos[m, n] cos(nφ) + sin[m, n] sin(nφ))
+    basis, labels = tensor_basis(point_group, source)
+    rank = basis.ndim - 1
+    theta = DEFAULT_INCIDENCE[geometry] if theta is None else theta
+    weights = field_weights(source, geometry, [channel], np.radians([theta]))[0, 0]
+    phi = np.linspace(0, 2 * np.pi, GENERATOR_POINTS, endpoint=False)
+    rotations = rotation_stack(phi + np.radians(PLANE_ROTATIONS[plane]))
+    amplitudes = np.array([rotated_tensors(tensor, rotations) @ weights for tensor in basis]).reshape(len(labels), -1)
+    spectrum = np.fft.rfft(amplitudes, axis=1)[:, :rank + 1] * (2 / GENERATOR_POINTS)
+    cos, sin = spectrum.real, -spectrum.imag
+    cos[:, 0] = cos[:, 0] / 2
+    sin[:, 0] = 0.0
+    for coefficients in (cos, sin):
+        coefficients[np.abs(coefficients) < COEFFICIENT_TOL] = 0.0
+    return np.round(cos, 12), np.round(sin, 12), labels
+
+def identifiable_parameters(cos: np.ndarray, sin: np.ndarray) -> Tuple[List[int], np.ndarray]:
+    #Within one channel several elements often feed the same harmonics, so only some combinations of them change the scan.
+    #Elements are taken in order as pivots while they add a new direction, and every other element is folded into the pivots
+    #it is a combination of. Parameter p is then Σ_m folded[p, m] χ_m (folded[p, pivot p] = 1) and the fit has full rank
+    features = np.hstack([cos, sin[:, 1:]])
+    pivots = []
+    for m in range(len(features)):
+        if np.linalg.matrix_rank(features[pivots + [m]], tol=RANK_TOL) > len(pivots):
+            pivots.append(m)
+    if not pivots:
+        return pivots, np.zeros((0, len(features)))
+    folded = np.round(np.linalg.lstsq(features[pivots].T, features.T, rcond=None)[0], 12)
+    folded[np.abs(folded) < COEFFICIENT_TOL] = 0.0
+    return pivots, folded
+
+def combination(coefficients: np.ndarray, symbols: List[Union[str, None]], number_format: str, product: str) -> str:
+    #Signed sum of coefficient * symbol, None symbols are bare constants
+    terms = []
+    for coefficient, symbol in zip(coefficients, symbols):
+        if coefficient == 0:
+            continue
+        magnitude = format(abs(coefficient), number_format)
+        if symbol is None:
+            body = magnitude
+        else:
+            body = symbol if abs(coefficient) == 1 else f'{magnitude}{product}{symbol}'
+        terms.append(('-' if coefficient < 0 else '+', body))
+    if not terms:
+        return '0'
+    text = ('-' if terms[0][0] == '-' else '') + terms[0][1]
+    for sign, body in terms[1:]:
+        text = f'{text} {sign} {body}'
+    return text
+
+def trig_symbols(order: int, kind: str, variable: str, prefix: str) -> List[Union[str, None]]:
+    #n = 0 is the constant term (sin(0φ) never carries a coefficient), n = 1 drops the multiplier
+    symbols = [None]
+    for n in range(1, order + 1):
+        symbols.append(f'{prefix}{kind}({variable})' if n == 1 else f'{prefix}{kind}({n}{"*" if prefix else ""}{variable})')
+    return symbols
+
+def amplitude_expression(cos: np.ndarray, sin: np.ndarray, names: List[str], number_format: str='.12g',
+                         product: str='*', variable: str='x', prefix: str='np.') -> str:
+    #Σ_n (Σ_m cos[m, n] χ_m) cos(nφ) + (Σ_m sin[m, n] χ_m) sin(nφ), grouped by harmonic so each trig term is evaluated once
+    order = cos.shape[1] - 1
+    parts = []
+    for kind, coefficients in (('cos', cos), ('sin', sin)):
+        for n, symbol in enumerate(trig_symbols(order, kind, variable, prefix)):
+            if not np.any(coefficients[:, n]):
+                continue
+            inner = combination(coefficients[:, n], names, number_format, product)
+            parts.append(f'({inner})' if symbol is None else f'({inner}){product}{symbol}')
+    return ' + '.join(parts) if parts else '0'
+
+def element_expression(cos: np.ndarray, sin: np.ndarray) -> str:
+    #Amplitude of a single element with unit value, the derivative of A(φ) with respect to it
+    order = cos.size - 1
+    symbols = trig_symbols(order, 'cos', 'x', 'np.') + trig_symbols(order, 'sin', 'x', 'np.')[1:]
+    return combination(np.concatenate([cos, sin[1:]]), symbols, '.12g', '*')
+
+def square_root_elements(g: np.ndarray, cos: np.ndarray, sin: np.ndarray, order: int) -> np.ndarray:
+    #Written as A(φ) = Σ_k α_k exp(ikφ) with |k| <= order, z^K A(z) is the square root of the polynomial z^2K I(z). It is
+    #taken term by term from the top harmonic down, which is exact for noise free data, and the elements follow by least squares
+    p = np.zeros(2 * order + 1, dtype=np.complex128) #p[j] = α_(j - K)
+    p[2 * order] = np.sqrt(g[2 * order])
+    for j in range(2 * order - 1, -1, -1):
+        known = sum(p[i] * p[2 * order + j - i] for i in range(j + 1, 2 * order) if j < 2 * order + j - i < 2 * order)
+        p[j] = (g[j] - known) / (2 * p[2 * order]) if p[2 * order] != 0 else 0.0
+    k = np.arange(-order, order + 1)
+    design = (cos[:, np.abs(k)] - 1j * np.sign(k) * sin[:, np.abs(k)]).T #α_k of each element, halved for k != 0
+    design[k != 0] = design[k != 0] / 2
+    return np.linalg.lstsq(np.vstack([design.real, design.imag]), np.concatenate([p.real, p.imag]), rcond=None)[0]
+
+def amplitude_guess(h: np.ndarray, cos: List[List[float]], sin: List[List[float]]) -> np.ndarray:
+    #Elements read off the intensity harmonics h (see fit_engine.harmonic_coefficients) for the model I(φ) = A(φ)².
+    #The square root divides by the top amplitude harmonic, so noise on a weak one is amplified. Every truncation order is
+    #tried, along with unequal elements scaled to the mean intensity, and the start closest to h is kept
+    cos, sin = np.asarray(cos, dtype=np.float64), np.asarray(sin, dtype=np.float64)
+    h = np.asarray(h, dtype=np.complex128)
+    g = np.concatenate([[h[0].real], h[1:] / 2]) #exp(inφ) coefficients of I for n >= 0
+    present = np.flatnonzero(np.any(cos, axis=0) | np.any(sin, axis=0))
+    orders = [order for order in present[::-1] if 2 * order < len(h) and (order == 0 or abs(g[2 * order]) > GUESS_TOL * abs(g[0]))]
+    points = max(GENERATOR_POINTS, 4 * len(h))
+    phi = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    harmonics = np.arange(cos.shape[1])
+    samples = np.cos(np.outer(phi, harmonics)) @ cos.T + np.sin(np.outer(phi, harmonics)) @ sin.T
+    start = np.linspace(1.0, 2.0, cos.shape[0])
+    candidates = [square_root_elements(g, cos, sin, int(order)) for order in orders]
+    candidates.append(start * np.sqrt(max(h[0].real, 0.0) / max(float(np.mean((samples @ start) ** 2)), COEFFICIENT_TOL)))
+
+    def misfit(c: np.ndarray) -> float:
+        spectrum = np.fft.rfft((samples @ c) ** 2)[:len(h)] / points
+        spectrum[1:] = 2 * spectrum[1:]
+        return float(np.sum(np.abs(spectrum - h) ** 2))
+
+    candidates = [c for c in candidates if np.all(np.isfinite(c))]
+    return min(candidates, key=misfit)
+
+def generated_entry(point_group: str, source: str, geometry: str, channel: str, plane: str='001',
+                    theta: Union[float, None]=None) -> Dict:
+    #Closed form I(φ) = A(φ)² of one point group in one channel, in the same YAML form as default_fits.yaml.
+    #Parameters are named after the elements they combine (chi_xxz_zxx_zzz), display_str gives the combination
+    cos, sin, labels = amplitude_harmonics(point_group, source, geometry, channel, plane, theta)
+    pivots, folded = identifiable_parameters(cos, sin)
+    if not pivots: #The channel is forbidden, a flat zero is still a candidate the data can rule in or out
+        return {'point_group': point_group, 'fit': 'lambda x, *p: 0 * x', 'jac': '', 'guess': 'lambda h: []',
+                'display_str': f'0 ({channel} forbidden)'}
+    cos, sin = cos[pivots], sin[pivots]
+    names, symbols = [], []
+    for row in folded:
+        members = np.flatnonzero(row)
+        names.append('chi_' + '_'.join(labels[m] for m in members))
+        if len(members) == 1:
+            symbols.append(f'χ{labels[members[0]]}')
+        else:
+            symbols.append(f"({combination(row, [f'χ{label}' for label in labels], '.3g', ' ')})")
+    arguments = ', '.join(names)
+    amplitude = amplitude_expression(cos, sin, names)
+    derivatives = ', '.join(f'2 * a * ({element_expression(cos[p], sin[p])})' for p in range(len(names)))
+    display = amplitude_expression(cos, sin, symbols, '.3g', ' ', 'Φ', '')
+    return {'point_group': point_group,
+            'fit': f'lambda x, {arguments}, *p: ({amplitude}) ** 2',
+            'jac': f'lambda x, {arguments}, *p: (lambda a: [{derivatives}])({amplitude})',
+            'guess': f'lambda h: amplitude_guess(h, {cos.tolist()!r}, {sin.tolist()!r})',
+            'display_str': f'[{display}]²'}
+
+def generate_entries(source: str, geometry: str, channel: str, plane: str='001', theta: Union[float, None]=None) -> List[Dict]:
+    #One model for every point group the source is allowed in, at the angle of incidence theta (the geometry's default if None)
+    if channel not in CHANNEL_POLARIZATIONS.get(geometry, {}):
+        raise ValueError(f"No {channel} channel in {geometry} geometry")
+    if plane not in PLANE_ROTATIONS:
+        raise ValueError(f"Unknown plane '{plane}', use {' or '.join(PLANE_ROTATIONS)}")
+    return [generated_entry(point_group, source, geometry, channel, plane, theta) for point_group in POINT_GROUP_GENERATORS
+            if get_reduction(point_group, source).labels]
+
+def generator_key(source: str, geometry: str, channel: str, plane: str='001', theta: Union[float, None]=None) -> bytes:
+    #Everything the generated expressions depend on, an edited group table or beam geometry gives a new key
+    theta = DEFAULT_INCIDENCE.get(geometry) if theta is None else float(theta)
+    inputs = (GENERATOR_VERSION, definitions_digest(), source, geometry, channel, plane, theta,
+              CHANNEL_POLARIZATIONS.get(geometry, {}).get(channel), PLANE_ROTATIONS.get(plane))
+    return repr(inputs).encode()
@@ -0,0 +1,149 @@
+import os
+import yaml
+import pickle
+import marshal
+import inspect
+import hashlib
+import pathlib
+import threading
+import importlib.util
+import numpy as np
+from typing import List, Tuple, Dict, Union, Callable
+
+from .sys_config import OS_CONFIG, PACKAGE_DIR, USER_CACHE_DIR
+from .cache import DiskCache
+from .data_classes import FitModel
+from .model_generator import generate_entries, generator_key, amplitude_guess
+
+FIT_NAMESPACE = {'np': np, 'amplitude_guess': amplitude_guess}
+#Hand written models only, data/point_groups.yaml just names the groups of each crystal system and the models of those
+#groups are generated from their reduced tensors (load_generated). An entry here replaces the generated model of its group
+DEFAULT_FITS_PATH = f'{PACKAGE_DIR}/fits/default_fits.yaml'
+MODEL_CACHE_DIR = f'{USER_CACHE_DIR}/models'
+REGISTRY_VERSION = 1
+CODE_FIELDS = ['fit', 'jac', 'guess'] #YAML keys holding python source
+HARMONIC_PROBE_POINTS = 64
+HARMONIC_PROBE_DRAWS = 3
+
+def compile_sources(entry: Dict) -> Dict[str, object]:
+    return {name: compile(entry[name], f"<{entry['point_group']} {name}>", 'eval') for name in CODE_FIELDS if entry.get(name)}
+
+def parse_bounds(bounds: Union[Dict, None], param_names: List[str]) -> List[Tuple[float, float]]:
+    #YAML bounds map parameter name -> [lower, upper], missing parameters are unbounded
+    bounds = bounds or {}
+    return [tuple(float(value) for value in bounds.get(name, [-np.inf, np.inf])) for name in param_names]
+
+def compile_model(entry: Dict, codes: Union[Dict[str, object], None]=None,
+                  param_names: Union[List[str], None]=None) -> FitModel:
+    model = FitModel(point_group=entry['point_group'], fit_str=entry['fit'], jac_str=entry.get('jac', ''),
+                     guess_str=entry.get('guess', ''), display_str=entry.get('display_str', ''))
+    if codes is None:
+        codes = compile_sources(entry)
+    #Each code object is eval'd exactly once, every later call runs on whole numpy arrays
+    model.func = eval(codes['fit'], dict(FIT_NAMESPACE))
+    if param_names is None:
+        params = list(inspect.signature(model.func).parameters.values())[1:]
+        param_names = [param.name for param in params if param.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD]
+    model.param_names = list(param_names)
+    if 'jac' in codes:
+        model.jac = eval(codes['jac'], dict(FIT_NAMESPACE))
+    if 'guess' in codes:
+        model.guess = eval(codes['guess'], dict(FIT_NAMESPACE))
+    model.bounds = parse_bounds(entry.get('bounds'), model.param_names)
+    return model
+
+def detect_harmonics(model: FitModel) -> List[int]:
+    #Orders n whose cos/sin(nφ) terms show up in the model, from an FFT of a few random parameter draws
+    phi = np.linspace(0, 2 * np.pi, HARMONIC_PROBE_POINTS, endpoint=False)
+    rng = np.random.default_rng(0)
+    magnitude = np.zeros(HARMONIC_PROBE_POINTS // 2 + 1)
+    for _ in range(HARMONIC_PROBE_DRAWS):
+        params = rng.uniform(0.5, 1.5, len(model.param_names))
+        values = np.asarray(model.func(phi, *params), dtype=np.float64) * np.ones_like(phi)
+        magnitude = np.maximum(magnitude, np.abs(np.fft.rfft(values)))
+    if not np.any(magnitude):
+        return [0]
+    return [int(n) for n in np.flatnonzero(magnitude > 1e-9 * magnitude.max())]
+
+def file_digest(data: bytes) -> str:
+    #Marshalled code is only valid for the interpreter that wrote it, so its bytecode magic is part of the key
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(data)
+    digest.update(importlib.util.MAGIC_NUMBER)
+    digest.update(str(REGISTRY_VERSION).encode())
+    return digest.hexdigest()
+
+class ModelRegistry:
+    def __init__(self, cache_dir: Union[pathlib.Path, str]=MODEL_CACHE_DIR, max_bytes: int=64 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.disk = DiskCache(cache_dir, max_bytes) #Compiled records, least recently used evicted past max_bytes
+        self.files = {} #absolute path or generator inputs -> (digest, models)
+        self.lock = threading.Lock()
+
+    def load(self, file_path: Union[pathlib.Path, str]=DEFAULT_FITS_PATH) -> Dict[str, FitModel]:
+        #Memory, then the compiled disk cache, then parsing the YAML, an edited file hashes to a new entry
+        file_path = os.path.abspath(file_path)
+        with open(file_path, 'rb') as file:
+            data = file.read()
+        return self.get_models(file_path, file_digest(data), lambda: yaml.safe_load(data) or [])
+
+    def load_generated(self, source: str, geometry: str, channel: str, plane: str='001',
+                       theta: Union[float, None]=None) -> Dict[str, FitModel]:
+        #Models derived from the reduced tensors for one channel, see model_generator. They are cached like a YAML file
+        #whose contents are the generator inputs, so a change to the symmetry definitions regenerates them
+        key = ('generated', source, geometry, channel, plane, theta)
+        digest = file_digest(generator_key(source, geometry, channel, plane, theta))
+        return self.get_models(key, digest, lambda: generate_entries(source, geometry, channel, plane, theta))
+
+    def get_models(self, key: Union[str, Tuple], digest: str, entries: Callable[[], List[Dict]]) -> Dict[str, FitModel]:
+        with self.lock:
+            loaded = self.files.get(key)
+            if loaded is not None and loaded[0] == digest:
+                return loaded[1]
+            models = self.read_cache(digest)
+            if models is None:
+                models, records = self.compile_entries(entries())
+                self.write_cache(digest, records)
+            self.files[key] = (digest, models)
+            return models
+
+    def compile_entries(self, entries: List[Dict]) -> Tuple[Dict[str, FitModel], List[Dict]]:
+        models = {}
+        records = []
+        for entry in entries:
+            codes = compile_sources(entry)
+            model = compile_model(entry, codes)
+            model.harmonics = detect_harmonics(model)
+            models[model.point_group] = model
+            records.append({'entry': entry, 'codes': {name: marshal.dumps(code) for name, code in codes.items()},
+                            'param_names': model.param_names, 'harmonics': model.harmonics})
+        return models, records
+
+    def read_cache(self, digest: str) -> Union[Dict[str, FitModel], None]:
+        if not OS_CONFIG.fit_disk_cache:
+            return None
+        try:
+            records = self.disk.load(digest)
+            models = {}
+            for record in records:
+                codes = {name: marshal.loads(code) for name, code in record['codes'].items()}
+                model = compile_model(record['entry'], codes, record['param_names'])
+                model.harmonics = record['harmonics']
+                models[model.point_group] = model
+            return models
+        except (OSError, pickle.PickleError, EOFError, ValueError, KeyError, TypeError):
+            return None
+
+    def write_cache(self, digest: str, records: List[Dict]) -> None:
+        if not OS_CONFIG.fit_disk_cache:
+            return
+        try:
+            self.disk.store(digest, records)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        with self.lock:
+            self.files.clear()
+
+MODEL_REGISTRY = ModelRegistry()
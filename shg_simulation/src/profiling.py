@@ -0,0 +1,112 @@
+import sys
+import json
+import time
+import pathlib
+import platform
+import importlib.abc
+from typing import Dict, Tuple, Union
+
+#Only the standard library is imported here, the profiler has to be running before anything heavy loads
+
+def peak_rss_bytes() -> Union[int, None]:
+    try:
+        import resource
+    except ImportError: #Windows, fall back to psutil if it happens to be installed
+        try:
+            import psutil
+            return int(psutil.Process().memory_info().peak_wset)
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if sys.platform == 'darwin' else peak * 1024) #macOS reports bytes, Linux kilobytes
+
+class _TimedLoader(importlib.abc.Loader):
+    #Wraps a module's real loader and times exec_module, time spent importing submodules is subtracted for self time
+    def __init__(self, loader, profiler, name: str):
+        self.loader = loader
+        self.profiler = profiler
+        self.name = name
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        stack = self.profiler.import_stack
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] = stack[-1] + elapsed
+            self.profiler.imports[self.name] = (elapsed - children, elapsed)
+
+    def __getattr__(self, name: str): #get_resource_reader, get_data, ... still reach the real loader
+        return getattr(self.loader, name)
+
+class _ImportFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(spec.loader, self.profiler, fullname)
+            return spec
+        return None
+
+class StartupProfiler:
+    def __init__(self, start_time: Union[float, None]=None, trace_imports: bool=False):
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.last_mark = self.start_time
+        self.phases = [] #(name, seconds, peak rss after the phase)
+        self.imports = {} #module -> (self seconds, cumulative seconds)
+        self.import_stack = []
+        self.finder = None
+        if trace_imports:
+            self.finder = _ImportFinder(self)
+            sys.meta_path.insert(0, self.finder)
+
+    def stop_tracing(self) -> None:
+        if self.finder is not None and self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+        self.finder = None
+
+    def mark(self, name: str) -> None:
+        #Ends a phase, every phase runs from the previous mark (or the profiler start) up to now
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last_mark, peak_rss_bytes()))
+        self.last_mark = now
+
+    def total(self) -> float:
+        return self.last_mark - self.start_time
+
+    def summary(self, deferred_modules: Tuple[str, ...]=()) -> str:
+        lines = [f"Startup time: {self.total():.3f}s"]
+        lines.extend(f"  {name:<16}{seconds:.3f}s" for name, seconds, rss in self.phases)
+        loaded = [module for module in deferred_modules if module in sys.modules]
+        lines.append(f"Deferred modules loaded before the first window: {', '.join(loaded) if loaded else 'none'}")
+        return '\n'.join(lines)
+
+    def report(self, version: str='unknown', deferred_modules: Tuple[str, ...]=()) -> Dict:
+        imports = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)
+        return {'version': version, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                'platform': platform.platform(), 'total_seconds': self.total(), 'peak_rss_bytes': peak_rss_bytes(),
+                'phases': [{'name': name, 'seconds': seconds, 'peak_rss_bytes': rss} for name, seconds, rss in self.phases],
+                'deferred_modules_loaded': [module for module in deferred_modules if module in sys.modules],
+                'imports': [{'module': module, 'self_seconds': self_time, 'cumulative_seconds': cumulative}
+                            for module, (self_time, cumulative) in imports]}
+
+    def dump(self, file_path: Union[pathlib.Path, str], version: str='unknown', deferred_modules: Tuple[str, ...]=()) -> str:
+        file_path = pathlib.Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, 'w') as file:
+            json.dump(self.report(version, deferred_modules), file, indent=2)
+        return str(file_path)
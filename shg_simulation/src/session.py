@@ -0,0 +1,138 @@
+import os
+import json
+import uuid
+import pathlib
+import numpy as np
+from typing import Dict, Union
+
+from .sys_config import USER_CACHE_DIR
+from .data_classes import FitConfig, ChannelData
+
+#Layout: 8 byte magic, uint64 header length, json header, then every array 64 byte aligned (raw little-endian)
+SESSION_MAGIC = b'SHGSESS1'
+SESSION_SUFFIX = '.shgs'
+SESSION_ALIGN = 64
+SESSION_DIR = f'{USER_CACHE_DIR}/sessions'
+
+def is_session_file(file_path: Union[pathlib.Path, str, None]) -> bool:
+    return file_path is not None and str(file_path).lower().endswith(SESSION_SUFFIX)
+
+def _aligned(offset: int) -> int:
+    return -(-offset // SESSION_ALIGN) * SESSION_ALIGN
+
+def _file_mtime(file_path: Union[pathlib.Path, str, None]) -> Union[float, None]:
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    return os.path.getmtime(file_path)
+
+def save_session(config: FitConfig, file_path: Union[pathlib.Path, str]) -> str:
+    arrays = []
+    layout = {}
+    for channel in config.channels:
+        data = config.data[channel]
+        layout[channel] = {}
+        for name in ['phi', 'r', 'sigma']:
+            array = getattr(data, name)
+            if array is None:
+                continue
+            array = np.ascontiguousarray(array, dtype=np.asarray(array).dtype.newbyteorder('<'))
+            layout[channel][name] = {'dtype': array.dtype.str, 'length': int(array.size), 'offset': 0}
+            arrays.append((channel, name, array))
+    header = {'version': 1, 'geometry': config.geometry, 'channels': config.channels, 'source': config.source,
+              'sys': config.sys, 'plane': config.plane, 'column_headers': config.column_headers,
+              'data_files': [None if file is None else str(file) for file in config.data_files],
+              'data_mtimes': [_file_mtime(file) for file in config.data_files], 'arrays': layout}
+
+    #Offsets depend on the header length, so the header is sized with room for the offset digits first
+    header_size = len(json.dumps(header).encode()) + 32 * len(arrays) + SESSION_ALIGN
+    offset = _aligned(16 + header_size)
+    for channel, name, array in arrays:
+        layout[channel][name]['offset'] = offset
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(header_size)
+
+    #Write to a temporary file and swap it in, a session that is still memory mapped keeps its old pages
+    file_path = pathlib.Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(f'.{file_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temp_path, 'wb') as file:
+        file.write(SESSION_MAGIC)
+        file.write(np.uint64(header_size).tobytes())
+        file.write(header_bytes)
+        for channel, name, array in arrays:
+            file.seek(layout[channel][name]['offset'])
+            file.write(array.tobytes())
+    try:
+        os.replace(temp_path, file_path)
+    except PermissionError: #Windows will not replace a file that is mapped, fall back to a fresh name
+        fallback = file_path.with_name(f'{file_path.stem}_{uuid.uuid4().hex[:8]}{SESSION_SUFFIX}')
+        os.replace(temp_path, fallback)
+        for stale in file_path.parent.glob(f'{file_path.stem}_*{SESSION_SUFFIX}'): #Earlier fallbacks that are no longer mapped
+            if stale != fallback:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    continue
+        file_path = fallback
+    return str(file_path)
+
+def session_backing(config: FitConfig) -> str:
+    #Session file every channel of config is already mapped from, when its header still describes config, otherwise ''.
+    #Saving such a config again would read every mapped page just to write the same bytes back
+    mapped = {getattr(getattr(config.data.get(channel), name, None), 'filename', None)
+              for channel in config.channels for name in ['phi', 'r']}
+    if len(mapped) != 1 or None in mapped:
+        return ''
+    file_path = mapped.pop()
+    try:
+        header = read_session_header(file_path)
+    except OSError:
+        return ''
+    if (header is None or header['channels'] != config.channels or header['column_headers'] != config.column_headers
+            or header['data_files'] != [None if file is None else str(file) for file in config.data_files]):
+        return ''
+    return str(file_path)
+
+def read_session_header(file_path: Union[pathlib.Path, str]) -> Union[Dict, None]:
+    with open(file_path, 'rb') as file:
+        if file.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            return None
+        header_size = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+        return json.loads(file.read(header_size).decode())
+
+def _map_channel(file_path: Union[pathlib.Path, str], layout: Dict) -> ChannelData:
+    #np.memmap only reads the pages that are actually touched, opening a large session is just the header read
+    arrays = {name: np.memmap(file_path, dtype=np.dtype(info['dtype']), mode='r', offset=info['offset'], shape=(info['length'],))
+              for name, info in layout.items() if info['length'] > 0}
+    empty = np.zeros(0)
+    return ChannelData(phi=arrays.get('phi', empty), r=arrays.get('r', empty), sigma=arrays.get('sigma'))
+
+def load_session(file_path: Union[pathlib.Path, str]) -> Union[FitConfig, None]:
+    header = read_session_header(file_path)
+    if header is None:
+        return None
+    config = FitConfig(geometry=header['geometry'], channels=header['channels'], source=header['source'],
+                       sys=header['sys'], plane=header['plane'], column_headers=header['column_headers'],
+                       data_files=header['data_files'], session_file=str(file_path))
+    config.data = {channel: _map_channel(file_path, header['arrays'][channel]) for channel in config.channels}
+    return config
+
+def load_session_channel(file_path: Union[pathlib.Path, str], channel: Union[str, None]=None) -> Union[ChannelData, None]:
+    header = read_session_header(file_path)
+    if header is None or not header['channels']:
+        return None
+    if channel is None:
+        channel = header['channels'][0]
+    if channel not in header['arrays']:
+        return None
+    return _map_channel(file_path, header['arrays'][channel])
+
+def session_matches_file(file_path: Union[pathlib.Path, str], data_file: Union[pathlib.Path, str], header: bool) -> bool:
+    #True when the session still holds an unmodified copy of data_file read with the same header setting
+    session_header = read_session_header(file_path)
+    if session_header is None or session_header['column_headers'] != header:
+        return False
+    for stored_file, stored_mtime in zip(session_header['data_files'], session_header['data_mtimes']):
+        if stored_file is not None and stored_file == str(data_file):
+            return stored_mtime is not None and stored_mtime == _file_mtime(data_file)
+    return False
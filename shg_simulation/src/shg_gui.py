@@ -1,10 +1,11 @@
 import sys
 import os
 import pathlib
-import matplotlib.pyplot as plt
+import numpy as np
+from typing import List, Tuple, Union, Callable
 from matplotlib.backends.backend_qtagg import NavigationToolbar2QT as NavigationToolbar, FigureCanvasQTAgg as FigureCanvas
 
-from PyQt6.QtCore import Qt, QLoggingCategory, pyqtSignal
+from PyQt6.QtCore import Qt, QLoggingCategory, QThreadPool, QTimer, pyqtSignal
 from PyQt6.QtGui import QDesktopServices
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QPushButton, QGridLayout, 
@@ -13,15 +14,25 @@ from PyQt6.QtWidgets import (
 
 from .sys_config import OS_CONFIG, PACKAGE_DIR
 from .gui_layouts import (
-    fit_res_create_layout, fit_inp_create_layout, sim_crystal_remove_layout, 
+    fit_res_create_layout, fit_res_fill_table, fit_res_add_table_row, fit_inp_create_layout, sim_crystal_remove_layout, 
     sim_key_upload_layout, sim_crystal_add_layout, sim_create_layout,
-    sim_create_crystal_table, main_create_layout, more_window_layout,
+    sim_create_crystal_table, sim_res_create_layout, main_create_layout, more_window_layout,
     data_help_layout, point_group_win_layout, visuals_win_layout,
     crystals_win_layout
 )
-from .data_classes import FitManager, FitConfig, FitInputManager, SimInputManager
+from .data_classes import FitManager, FitConfig, FitInputManager, SimInputManager, SimConfig
 from .custom_widgets import PlotWidget, GroupLabel, ClickableFigureCanvas
-from .utils import test_api_key, remove_crystal, read_data, convert_to_config_str, polar_plot
+from .utils import (
+    test_api_key, remove_crystal, read_data, convert_to_config_str, convert_to_gui_str, polar_plot, to_channel_data,
+    find_crystal
+)
+from .simulation import simulate, crystal_point_group
+from .symmetry import allowed_sources
+from .lod import select_level, level_points, scatter_points
+from .workers import Worker, read_data_task, fit_task, render_task, save_session_task
+from .figure_cache import FigureCache
+from .metrics import METRICS
+from .session import SESSION_DIR, SESSION_SUFFIX, session_backing, session_matches_file, is_session_file
 
 class AdditionalWindow(QWidget):
     def __init__(self, win_type, parent=None) -> None: #Init the window
@@ -82,23 +93,51 @@ class PlotWindow(QWidget):
         self.config = config
         if not data_upload:
             self.fits = [point_group for point_group in point_groups if point_group.active == True and point_group.channel == channel]
-            self.fig, self.ax = polar_plot(title=channel, data=self.config.data[channel], 
+            self.data = to_channel_data(self.config.data[channel])
+            self.fig, self.ax = polar_plot(title=channel, data=self.data, 
                                        width=OS_CONFIG.full_plt_len, height=OS_CONFIG.full_plt_len, 
-                                       dpi=OS_CONFIG.full_plt_dpi, data_color=data_color, fits=self.fits)
+                                       dpi=OS_CONFIG.full_plt_dpi, data_color=data_color, fits=self.fits,
+                                       pixels=OS_CONFIG.full_plt_len)
         else:
-            self.fig, self.ax = polar_plot(title=channel, data=self.config, 
+            self.data = to_channel_data(self.config)
+            self.fig, self.ax = polar_plot(title=channel, data=self.data, 
                                        width=OS_CONFIG.full_plt_len, height=OS_CONFIG.full_plt_len, 
-                                       dpi=OS_CONFIG.full_plt_dpi, data_color=data_color)
+                                       dpi=OS_CONFIG.full_plt_dpi, data_color=data_color, pixels=OS_CONFIG.full_plt_len)
 
+        self.scatter = self.ax.collections[0]
+        level = select_level(self.data, OS_CONFIG.full_plt_len)
+        self.detail = None if level is None else id(level)
+        self.home_rmax = self.ax.get_rmax()
         self.canvas = FigureCanvas(self.fig)
         self.toolbar = NavigationToolbar(self.canvas, self)
         self.layout = QVBoxLayout()
         self.layout.addWidget(self.toolbar)
         self.layout.addWidget(self.canvas)
         self.setLayout(self.layout)
+        #Zooming with the toolbar (right drag in pan mode) changes the radial limits, finer detail is swapped in once it ends.
+        #Polar drags set the limits directly without a ylim_changed callback, so the mouse release is watched as well
+        self.ax.callbacks.connect('ylim_changed', self.update_detail)
+        self.canvas.mpl_connect('button_release_event', self.update_detail)
+        self.canvas.mpl_connect('resize_event', self.update_detail)
+
+    def update_detail(self, *args) -> None:
+        r_min, r_max = self.ax.get_ylim()
+        zoom = max(1.0, self.home_rmax / max(r_max, np.finfo(float).tiny))
+        level = select_level(self.data, max(self.canvas.width(), self.canvas.height()) * zoom)
+        r_range = (r_min, r_max) if zoom > 1.0 else None
+        detail = id(level) if level is not None else r_range
+        if detail == self.detail:
+            return
+        if level is not None:
+            phi, r = level_points(level)
+        else: #Past the finest level, back to the full resolution scan
+            phi, r = scatter_points(self.data, r_range=r_range)
+        self.detail = detail
+        self.scatter.set_offsets(np.column_stack([phi, r]))
+        self.canvas.draw_idle()
 
     def closeEvent(self, event) -> None:
-        plt.close(self.fig) 
+        self.fig.clear()
         event.accept()
         
 class FitResults(QWidget):
@@ -110,6 +149,9 @@ class FitResults(QWidget):
         self.layout, self.swap_button_group, self.add_button_group = fit_res_create_layout(config)
         self.full_button_group = None
         self.close_button_group = None
+        self.fit_button_group = None
+        self.plot_layouts = []
+        self.figure_cache = FigureCache()
         self.set_button_clicks()
         self.setLayout(self.layout)
         self.setFixedSize(self.layout.sizeHint())
@@ -117,6 +159,9 @@ class FitResults(QWidget):
         self.group_win = None
         self.visuals_win = None
         self.plot_win = None
+        self.fit_worker = None
+        self.render_worker = None
+        self.run_fits()
 
     def set_button_clicks(self) -> None:
         self.layout.itemAtPosition(2,0).widget().clicked.connect(self.back_to_input)
@@ -137,6 +182,63 @@ class FitResults(QWidget):
         for button in self.swap_button_group.buttons():
             button.clicked.connect(self.swap_button_clicked)
 
+    def run_fits(self) -> None: #Fits run on a worker thread, rows stream into the table as each one finishes
+        self.fit_table().setRowCount(0)
+        self.fit_worker = Worker(fit_task, self.config)
+        self.fit_worker.signals.partial.connect(self.add_fit_row)
+        self.fit_worker.signals.progress.connect(self.fit_progress)
+        self.fit_worker.signals.result.connect(self.fits_finished)
+        self.fit_worker.signals.error.connect(self.task_failed)
+        QThreadPool.globalInstance().start(self.fit_worker)
+
+    def add_fit_row(self, point_group) -> None: #Rows are streamed in completion order, fill_table re-ranks them by R² once all fits finish
+        check_box = fit_res_add_table_row(self.fit_table(), point_group)
+        check_box.setEnabled(False) #Toggling needs the ranked point groups, fill_table replaces the row with a live checkbox
+
+    def fit_progress(self, completed, total) -> None:
+        self.setWindowTitle(f"Fit Results (fitting {completed}/{total})")
+
+    def fits_finished(self, point_groups) -> None:
+        self.setWindowTitle("Fit Results")
+        self.fit_worker = None
+        self.manager.point_groups = point_groups
+        self.fill_table()
+        if self.manager.plots_showing:
+            self.generate_plots()
+
+    def task_failed(self, message) -> None: #Fit or render worker error, message is the worker's traceback
+        if self.fit_worker is not None and self.sender() is self.fit_worker.signals:
+            self.setWindowTitle("Fit Results (fitting failed)")
+            self.fit_worker = None
+        elif self.render_worker is not None and self.sender() is self.render_worker.signals:
+            self.render_worker = None
+        else: #From a worker that has since been replaced
+            return
+        self.error = QMessageBox(self)
+        self.error.setIcon(QMessageBox.Icon.Critical)
+        self.error.setWindowTitle("Unable to Continue")
+        self.error.setText(f"Error: \'{message.strip().splitlines()[-1]}\'.\nPlease try again.")
+        self.error.setDetailedText(message)
+        self.error.show()
+
+    def fit_table(self):
+        return self.layout.itemAtPosition(0,0).widget().layout().itemAt(0).widget()
+
+    def fill_table(self) -> None:
+        self.fit_button_group = fit_res_fill_table(self.fit_table(), self.manager.point_groups)
+        for button in self.fit_button_group.buttons():
+            button.clicked.connect(self.fit_toggled)
+
+    def fit_toggled(self) -> None:
+        button = self.sender()
+        point_group = self.manager.point_groups[self.fit_button_group.id(button)]
+        point_group.active = button.isChecked()
+        if point_group.channel in self.manager.plots_showing:
+            self.figure_cache.sync(point_group.channel, self.manager.data_color, self.active_fits(point_group.channel))
+
+    def active_fits(self, channel) -> List:
+        return [point_group for point_group in self.manager.point_groups if point_group.active == True and point_group.channel == channel]
+
     def toggle_expand(self) -> None:
         current_index = self.layout.itemAtPosition(1,1).currentIndex()
         new_index = 1 - current_index
@@ -233,12 +335,10 @@ class FitResults(QWidget):
            self.manager.selected_channels.append(channel) 
         self.update_selection()
     
-    def data_color_changed(self, color) -> None:
+    def data_color_changed(self, color) -> None: #Only the scatter colour changes, cached figures are recoloured in place
         self.manager.data_color = color.lower()
-        if self.manager.plots_showing:
-            self.generate_plots()
-        else:
-            self.generate_plots(no_plots=True)
+        for channel in self.manager.plots_showing:
+            self.figure_cache.sync(channel, self.manager.data_color, self.active_fits(channel))
 
     def selection_mode_changed(self, mode) -> None:
         self.manager.selection_mode = mode 
@@ -262,9 +362,11 @@ class FitResults(QWidget):
             return
 
         plot_id = 0
-        self.manager.figures = []
+        self.manager.figures = [None] * len(self.manager.plots_showing)
+        self.plot_layouts = []
+        plots = []
         for channel in self.manager.plots_showing:
-            fits = [point_group for point_group in self.manager.point_groups if point_group.active == True and point_group.channel == channel]
+            fits = self.active_fits(channel)
             channel_layout = QGridLayout()
             sub_layout = QVBoxLayout()
             enlarge_button = QPushButton('⤢')
@@ -283,17 +385,14 @@ class FitResults(QWidget):
             self.full_button_group.setId(enlarge_button, plot_id)
             self.close_button_group.addButton(close_button)
             self.close_button_group.setId(close_button, plot_id)
-            fig, ax = polar_plot(title=channel, data=self.config.data[channel], 
-                         width=(OS_CONFIG.fit_res_mini_plt_r/OS_CONFIG.fit_res_mini_plt_dpi) * 2, 
-                         height=(OS_CONFIG.fit_res_mini_plt_r/OS_CONFIG.fit_res_mini_plt_dpi) * 2, 
-                         dpi=OS_CONFIG.fit_res_mini_plt_dpi, data_color=self.manager.data_color, fits=fits)
-            canvas = ClickableFigureCanvas(figure=fig, plot_id=plot_id, radius=OS_CONFIG.fit_res_mini_plt_r)
-            canvas.canvas_signal.connect(self.canvas_clicked)
-            self.manager.figures.append((fig, canvas))
-            canvas.setFixedSize(OS_CONFIG.fit_res_mini_plt_r * 2, OS_CONFIG.fit_res_mini_plt_r * 2)
-
-            channel_layout.addWidget(canvas, 0, 0, alignment=Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignLeft)
             channel_layout.addLayout(sub_layout, 0, 0, alignment=Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignRight)
+            self.plot_layouts.append(channel_layout)
+            entry = self.figure_cache.get(channel, self.config.data[channel])
+            if entry is None: #Canvas is added in plot_rendered once the worker has built the figure
+                plots.append((plot_id, channel, self.config.data[channel], fits))
+            else:
+                self.figure_cache.sync(channel, self.manager.data_color, fits)
+                self.place_canvas(plot_id, entry.fig, entry.canvas)
             group_box = QGroupBox()
             group_box.setFixedSize(350, 325)
             group_box.setLayout(channel_layout)
@@ -311,11 +410,45 @@ class FitResults(QWidget):
         self.setLayout(self.layout)
 
         self.update_selection()
+        if not plots:
+            return
+
+        self.render_worker = Worker(render_task, plots, 
+                                    width=(OS_CONFIG.fit_res_mini_plt_r/OS_CONFIG.fit_res_mini_plt_dpi) * 2, 
+                                    height=(OS_CONFIG.fit_res_mini_plt_r/OS_CONFIG.fit_res_mini_plt_dpi) * 2, 
+                                    dpi=OS_CONFIG.fit_res_mini_plt_dpi, data_color=self.manager.data_color)
+        self.render_worker.signals.partial.connect(self.plot_rendered)
+        self.render_worker.signals.error.connect(self.task_failed)
+        QThreadPool.globalInstance().start(self.render_worker)
+
+    def plot_rendered(self, rendered) -> None:
+        if self.render_worker is None or self.sender() is not self.render_worker.signals: #Figure from a render that has since been replaced
+            return
+        plot_id, channel, fig, fits = rendered
+        canvas = ClickableFigureCanvas(figure=fig, plot_id=plot_id, radius=OS_CONFIG.fit_res_mini_plt_r,
+                                        highlight=OS_CONFIG.selection_highlight)
+        canvas.canvas_signal.connect(self.canvas_clicked)
+        canvas.setFixedSize(OS_CONFIG.fit_res_mini_plt_r * 2, OS_CONFIG.fit_res_mini_plt_r * 2)
+        self.figure_cache.add(channel, self.config.data[channel], fig, canvas, self.manager.data_color, fits)
+        #Colour or fits may have changed while the figure was being built
+        self.figure_cache.sync(channel, self.manager.data_color, self.active_fits(channel))
+        self.place_canvas(plot_id, fig, canvas)
+        self.update_selection()
+
+    def place_canvas(self, plot_id, fig, canvas) -> None:
+        canvas.plot_id = plot_id
+        self.manager.figures[plot_id] = (fig, canvas)
+        self.plot_layouts[plot_id].addWidget(canvas, 0, 0, alignment=Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignLeft)
+        canvas.show()
+        self.full_button_group.button(plot_id).raise_()
+        self.close_button_group.button(plot_id).raise_()
 
     def clear_plots(self) -> None:
-        if self.manager.figures:
-            for fig, canvas in self.manager.figures:
-                plt.close(fig) 
+        if self.render_worker is not None:
+            self.render_worker.cancel()
+            self.render_worker = None
+        self.figure_cache.detach_all()
+        self.manager.figures = []
         for i in reversed(range(self.layout.itemAtPosition(1,2).widget().layout().count())):
             widget = self.layout.itemAtPosition(1,2).widget().layout().itemAt(i).widget()
             if widget is not None:
@@ -324,11 +457,12 @@ class FitResults(QWidget):
 
     def update_selection(self) -> None:
         if self.manager.plots_showing:
-            for fig, canvas in self.manager.figures:
+            for fig, canvas in filter(None, self.manager.figures):
                 canvas.remove_glow_effect()
         for channel in self.manager.selected_channels:
             selected_id = self.manager.plots_showing.index(channel)
-            self.manager.figures[selected_id][1].apply_glow_effect()
+            if self.manager.figures[selected_id] is not None:
+                self.manager.figures[selected_id][1].apply_glow_effect()
 
         if self.manager.selection_mode == 'Multiple':
             for button in self.swap_button_group.buttons(): 
@@ -344,14 +478,21 @@ class FitResults(QWidget):
         self.layout.itemAtPosition(2,2).widget().setText(sel_chan_text)
         
     def back_to_input(self) -> None:
+        #Parsed channels are kept in a memory mapped session so a re-run skips the CSV parsing. Channels already mapped
+        #from a session are left as they are, anything else is written on a worker so a large session never blocks the gui
+        self.config.session_file = session_backing(self.config)
         self.win = FittingInput(config=self.config)
+        if not self.config.session_file:
+            self.win.save_session(f'{SESSION_DIR}/last_session{SESSION_SUFFIX}')
         self.win.show()
         self.close()
 
     def closeEvent(self, event) -> None:
-        if self.manager.figures:
-            for fig, canvas in self.manager.figures:
-                plt.close(fig) 
+        if self.fit_worker is not None:
+            self.fit_worker.cancel()
+        if self.render_worker is not None:
+            self.render_worker.cancel()
+        self.figure_cache.clear()
         if self.plot_win is not None and self.plot_win:
             self.plot_win.close()
         if self.group_win is not None and self.group_win:
@@ -374,10 +515,20 @@ class FittingInput(QWidget):
         
         self.additional_win = None
         self.plot_win = None
+        self.load_worker = None
+        self.save_worker = None
 
         self.config = config
         if self.config:
             self.set_config()
+
+    def save_session(self, file_path: str) -> None:
+        self.save_worker = Worker(save_session_task, self.config, file_path)
+        self.save_worker.signals.result.connect(self.session_saved)
+        QThreadPool.globalInstance().start(self.save_worker)
+
+    def session_saved(self, file_path: str) -> None: #A failed save just leaves the next run reading the CSVs
+        self.config.session_file = file_path
  
     def set_button_clicks(self) -> None: #Sets all buttons and button groups to the proper methods
         self.layout.itemAtPosition(5,0).widget().clicked.connect(self.back_to_main)
@@ -527,18 +678,53 @@ class FittingInput(QWidget):
         else:
             self.layout.itemAtPosition(5,2).widget().setEnabled(False)
 
-    def run_button_clicked(self) -> None:
-        self.layout.itemAtPosition(5,2).widget().setEnabled(False)
-        config = self.generate_config()
+    def run_button_clicked(self) -> None: #While files are loading the run button acts as a cancel button
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            return
+        self.layout.itemAtPosition(5,2).widget().setText('Cancel')
+        self.load_worker = Worker(read_data_task, self.selected_data_sources(), self.manager.column_headers)
+        self.load_worker.signals.progress.connect(self.load_progress)
+        self.load_worker.signals.result.connect(self.data_loaded)
+        self.load_worker.signals.error.connect(self.error_win)
+        self.load_worker.signals.finished.connect(self.load_finished)
+        QThreadPool.globalInstance().start(self.load_worker)
+
+    def load_progress(self, completed, total) -> None:
+        self.setWindowTitle(f"Data Import (loading {completed}/{total})")
+
+    def load_finished(self) -> None:
+        self.load_worker = None
+        self.setWindowTitle("Data Import")
+        self.layout.itemAtPosition(5,2).widget().setText('Run')
+
+    def data_loaded(self, data_list) -> None:
+        config = self.generate_config(data_list)
         if isinstance(config, FitConfig):
             self.win = FitResults(config)
             self.win.show()
             self.close()
         else:
             self.error_win(message=config)
-            self.layout.itemAtPosition(5,2).widget().setEnabled(True)
 
-    def generate_config(self) -> FitConfig:
+    def selected_data_sources(self) -> List[Tuple[str, str]]: #(file to read, channel) for every selected channel
+        if convert_to_config_str(self.geo_button_group.checkedButton().text()) == 'trans':
+            channels = ["||", "⊥"]
+            sources = [(self.manager.data_files[i], channels[i]) for i in range(2) if channels[i] in self.manager.valid_channels]
+        else:
+            channels = ["SS", "PP", "SP", "PS"]
+            sources = [(self.manager.data_files[i+2], channels[i]) for i in range(4) if channels[i] in self.manager.valid_channels]
+        session_file = self.config.session_file if self.config else ''
+        for i, (data_file, channel) in enumerate(sources):
+            channel = convert_to_config_str(channel)
+            if (not is_session_file(data_file) and session_file and pathlib.Path(session_file).exists()
+                and session_matches_file(session_file, data_file, self.manager.column_headers)):
+                data_file = session_file
+            sources[i] = (data_file, channel)
+        return sources
+
+    @METRICS.timed('config_validation_seconds')
+    def generate_config(self, data_list: List) -> Union[FitConfig, str]:
         config = FitConfig()
 
         config.geometry = convert_to_config_str(self.geo_button_group.checkedButton().text())
@@ -547,25 +733,17 @@ class FittingInput(QWidget):
         config.sys = convert_to_config_str(self.system_button_group.checkedButton().text())
         config.plane = convert_to_config_str(self.planes_button_group.checkedButton().text())
 
-        if config.geometry == 'trans':
-            channels = ["||", "⊥"]
-            data_list = [read_data(data_path=self.manager.data_files[i], header=self.manager.column_headers) 
-                for i in range(2) if channels[i] in self.manager.valid_channels]
-        else:
-            channels = ["SS", "PP", "SP", "PS"]
-            data_list = [read_data(data_path=self.manager.data_files[i+2], header=self.manager.column_headers) 
-                for i in range(4) if channels[i] in self.manager.valid_channels]
-
+        errors = [data if isinstance(data, str) else '' for data in data_list] #read_data returns an error string or ChannelData
         no_data = [convert_to_config_str(self.manager.valid_channels[i]) 
-            for i in range(len(data_list)) if data_list[i] == "No data"]
+            for i in range(len(errors)) if errors[i] == "No data"]
         too_many_columns = [convert_to_config_str(self.manager.valid_channels[i]) 
-            for i in range(len(data_list)) if data_list[i] == "Too many columns"]
+            for i in range(len(errors)) if errors[i] == "Too many columns"]
         too_few_columns = [convert_to_config_str(self.manager.valid_channels[i]) 
-            for i in range(len(data_list)) if data_list[i] == "Too few columns"]
+            for i in range(len(errors)) if errors[i] == "Too few columns"]
         incorrect_types = [convert_to_config_str(self.manager.valid_channels[i]) 
-            for i in range(len(data_list)) if data_list[i] == "Incorrect dtype"]
+            for i in range(len(errors)) if errors[i] == "Incorrect dtype"]
         missing_types = [convert_to_config_str(self.manager.valid_channels[i]) 
-            for i in range(len(data_list)) if data_list[i] == "Missing data elem"]
+            for i in range(len(errors)) if errors[i] == "Missing data elem"]
         
         if len(no_data) > 0:
             return f"No data in uploaded file for channel(s): {', '.join(no_data)}"
@@ -588,7 +766,7 @@ class FittingInput(QWidget):
         button_id = self.upload_button_group.id(button)
         #Gets corresponding text box for the sender
         text_box = self.layout.itemAtPosition(1,0).widget().layout().itemAtPosition(1,0).itemAt(button_id).itemAt(1).widget() 
-        file = QFileDialog.getOpenFileName(self, 'Open file', '','csv files (*.csv)') #Restrict file uploads to .csv documents only
+        file = QFileDialog.getOpenFileName(self, 'Open file', '',f'csv files (*.csv);;SHG sessions (*{SESSION_SUFFIX})') #Restrict file uploads to .csv documents and saved sessions
         text_box.clear()
         if not file[0]: #If user did not select a valid file, then clear all entries for that chan
             self.manager.data_files[button_id] = None
@@ -603,23 +781,24 @@ class FittingInput(QWidget):
         button = self.sender()
         button_id = self.full_button_group.id(button)
         data_file = self.manager.data_files[button_id]
-        data = read_data(data_path=data_file, header=self.manager.column_headers)
         channels = ["||", "⊥", "SS", "PP", "SP", "PS"]
         channel = channels[button_id]
+        data = read_data(data_path=data_file, header=self.manager.column_headers, channel=convert_to_config_str(channel))
+        error = data if isinstance(data, str) else ''
 
-        if data == 'No data':
+        if error == 'No data':
             self.error_win(message=f'No data found in the upload file for channel: {channel}')
             return
-        elif data == 'Too many columns':
+        elif error == 'Too many columns':
             self.error_win(message=f'Too many data columns in uploaded file for channel: {channel}')
             return
-        elif data == 'Too few columns':
+        elif error == 'Too few columns':
             self.error_win(message=f'Missing required data columns in uploaded file for channel: {channel}')
             return
-        elif data == 'Incorrect dtype':
+        elif error == 'Incorrect dtype':
             self.error_win(message=f'Incorrect data types for data in uploaded file for channel: {channel}')
             return
-        elif data == 'Missing data elem':
+        elif error == 'Missing data elem':
             self.error_win(message=f'Missing data elements for data in uploaded file for channel: {channel}')
             return
         self.plot_win = PlotWindow(channel=convert_to_config_str(channel), config=data, data_color='blue', data_upload=True)
@@ -649,6 +828,8 @@ class FittingInput(QWidget):
         self.close()
 
     def closeEvent(self, event) -> None:
+        if self.load_worker is not None:
+            self.load_worker.cancel()
         if self.additional_win is not None and self.additional_win:
             self.additional_win.close()
         if self.plot_win is not None and self.plot_win:
@@ -831,9 +1012,55 @@ class SimAddCrystal(QWidget):
         event.accept()
 
 class SimSearchResults(QWidget):
-    def __init__(self, crystal=str, parent=None) -> None: #Init the window
+    def __init__(self, crystal: dict, parent=None) -> None: #Init the window
         super().__init__(parent)
-        self.setWindowTitle("Search Results")
+        self.setWindowTitle("Simulation Results")
+        self.crystal = crystal
+        self.point_group = crystal_point_group(crystal)
+        self.sources = allowed_sources(self.point_group)
+        self.layout = sim_res_create_layout(f'{crystal["name"]} ({crystal["symbol"]}), {self.point_group}',
+                                            [convert_to_gui_str(source) for source in self.sources])
+        self.canvases = []
+        self.set_button_clicks()
+        self.setLayout(self.layout)
+        self.update_plots()
+
+    def set_button_clicks(self) -> None:
+        self.layout.itemAtPosition(3,0).widget().clicked.connect(self.back_to_selection)
+        self.layout.itemAtPosition(1,0).layout().itemAt(1).widget().signal.connect(self.update_plots)
+        self.layout.itemAtPosition(1,0).layout().itemAt(3).widget().signal.connect(self.update_plots)
+
+    def update_plots(self, *args) -> None: #Every channel of both geometries is simulated, one einsum per geometry
+        source = convert_to_config_str(self.layout.itemAtPosition(1,0).layout().itemAt(1).widget().currentText())
+        plane = convert_to_config_str(self.layout.itemAtPosition(1,0).layout().itemAt(3).widget().currentText())
+        plot_layout = self.layout.itemAtPosition(2,0).widget().layout()
+        for canvas in self.canvases:
+            canvas.figure.clear()
+            canvas.setParent(None)
+            canvas.deleteLater()
+        self.canvases = []
+        size = (OS_CONFIG.fit_res_mini_plt_r / OS_CONFIG.fit_res_mini_plt_dpi) * 2
+        for row, geometry in enumerate(['refl', 'trans']):
+            results = simulate(SimConfig(point_group=self.point_group, source=source, geometry=geometry, plane=plane))
+            for column, (channel, data) in enumerate(results.items()):
+                fig, ax = polar_plot(title=convert_to_gui_str(channel), data=data, width=size, height=size,
+                                     dpi=OS_CONFIG.fit_res_mini_plt_dpi, data_color='blue')
+                canvas = FigureCanvas(fig)
+                canvas.setFixedSize(OS_CONFIG.fit_res_mini_plt_r * 2, OS_CONFIG.fit_res_mini_plt_r * 2)
+                plot_layout.addWidget(canvas, row, column)
+                self.canvases.append(canvas)
+        self.layout.activate() #The plots were swapped after the layout last sized itself
+        self.setFixedSize(self.layout.sizeHint())
+
+    def back_to_selection(self) -> None:
+        self.win = SimSelection()
+        self.win.show()
+        self.close()
+
+    def closeEvent(self, event) -> None:
+        for canvas in self.canvases:
+            canvas.figure.clear()
+        event.accept()
 
 class SimSelection(QWidget):
     def __init__(self, parent=None) -> None: #Init the window
@@ -938,7 +1165,23 @@ class SimSelection(QWidget):
             self.layout.itemAtPosition(1,0).widget().layout().itemAtPosition(0,2).layout().itemAt(2).widget().setEnabled(True)
         
     def run_button_clicked(self) -> None:
-       pass 
+        crystal_name = {'Unary': self.manager.unary_crysal, 'Binary': self.manager.binary_crysal,
+                        'Tertiary': self.manager.tertiary_crystal}[self.manager.crystal_type]
+        if pathlib.Path(f'{PACKAGE_DIR}/data/custom_crystals.yaml').exists():
+            crystal = find_crystal(crystal_name, file_path=f'{PACKAGE_DIR}/data/custom_crystals.yaml')
+        else:
+            crystal = find_crystal(crystal_name, file_path=f'{PACKAGE_DIR}/data/default_crystals.yaml')
+        try:
+            self.win = SimSearchResults(crystal)
+        except (TypeError, KeyError, ValueError) as error: #Missing crystal or a point group the simulation doesn't know
+            message = QMessageBox(self)
+            message.setIcon(QMessageBox.Icon.Critical)
+            message.setWindowTitle("Unable to Continue")
+            message.setText(f"Error: \'{error}\'.\nPlease try again.")
+            message.show()
+            return
+        self.win.show()
+        self.close()
 
     def back_to_main(self) -> None:
         self.win = MainWindow()
@@ -991,10 +1234,16 @@ class MainWindow(QWidget):
             self.additional_win.close()
         event.accept()
 
-def init_gui():
+def init_gui(on_shown: Union[Callable[[], None], None]=None, mark: Union[Callable[[str], None], None]=None):
+    mark = mark or (lambda name: None) #Startup profiler hook, ends a named phase
     app = QApplication(sys.argv)
     QLoggingCategory.setFilterRules("qt.qpa.fonts.warning=false")
     QApplication.instance().setStyleSheet(OS_CONFIG.style_sheet)
+    mark('qt application')
     window = MainWindow()
+    mark('main window')
     window.show()
+    mark('show')
+    if on_shown is not None: #Runs from the event loop, once the main window has been laid out and painted
+        QTimer.singleShot(0, on_shown)
     app.exec()
@@ -0,0 +1,164 @@
+import functools
+import numpy as np
+from typing import List, Tuple, Dict, Union, Iterator
+
+from .data_classes import SimConfig, ChannelData
+from .symmetry import get_reduction, expand_tensor, normalize_point_group, tensor_basis
+from .metrics import METRICS
+
+#Lab frame: z is the sample normal, the plane of incidence is xz and the sample rotates about z by φ.
+#Channels are <incident><analyzer> polarizations, e.g. SP is S in and P out. Fresnel and local field factors are taken as 1
+CHANNEL_POLARIZATIONS = {
+    'refl': {'SS': ('s', 's'), 'PP': ('p', 'p'), 'SP': ('s', 'p'), 'PS': ('p', 's')},
+    'trans': {'Parallel': ('p', 'p'), 'Perpendicular': ('p', 's')},
+}
+DEFAULT_INCIDENCE = {'refl': 30.0, 'trans': 0.0} #Degrees from the sample normal
+PLANE_ROTATIONS = {'001': 0.0, 'rotz90': 90.0} #Starting azimuth of the crystal axes in degrees
+SIM_MEMORY_BUDGET = 256 * 1024 ** 2 #Working memory of one (θ, φ) chunk, the full result is allocated on top of it
+
+def beam_vectors(geometry: str, theta: float) -> Dict[str, np.ndarray]:
+    #Unit wave vectors and polarizations of the fundamental (in) and the SHG (out) in the lab frame
+    sin, cos = np.sin(theta), np.cos(theta)
+    k_in = np.array([sin, 0.0, -cos])
+    p_in = np.array([cos, 0.0, sin])
+    if geometry == 'refl':
+        k_out, p_out = np.array([sin, 0.0, cos]), np.array([-cos, 0.0, sin])
+    elif geometry == 'trans':
+        k_out, p_out = k_in, p_in
+    else:
+        raise ValueError(f"Unknown geometry '{geometry}', use refl or trans")
+    s = np.array([0.0, 1.0, 0.0])
+    return {'k_in': k_in, 'k_out': k_out, 'in': {'s': s, 'p': p_in}, 'out': {'s': s, 'p': p_out}}
+
+def rotation_stack(phi: np.ndarray) -> np.ndarray:
+    #R_z(φ) for every azimuth, shape (N, 3, 3)
+    cos, sin = np.cos(phi), np.sin(phi)
+    stack = np.zeros((phi.size, 3, 3))
+    stack[:, 0, 0], stack[:, 0, 1] = cos, -sin
+    stack[:, 1, 0], stack[:, 1, 1] = sin, cos
+    stack[:, 2, 2] = 1.0
+    return stack
+
+@functools.lru_cache(maxsize=256)
+def contraction_path(subscripts: str, *shapes: Tuple[int, ...]) -> List:
+    #Finding the contraction order costs more than running it on small tensors, so the plan is found once per shape
+    operands = [np.empty(shape) for shape in shapes]
+    return np.einsum_path(subscripts, *operands, optimize='optimal')[0]
+
+def contract(subscripts: str, *operands: np.ndarray, out: Union[np.ndarray, None]=None) -> np.ndarray:
+    path = contraction_path(subscripts, *[operand.shape for operand in operands])
+    if out is None:
+        return np.einsum(subscripts, *operands, optimize=path)
+    return np.einsum(subscripts, *operands, optimize=path, out=out)
+
+def rotated_tensors(chi: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+    #χ in the lab frame at every azimuth, (N, 3**rank). Rotating the crystal by R takes χ_abc to R_ia R_jb R_kc χ_abc
+    rank = chi.ndim
+    letters = 'abcd'[:rank]
+    targets = 'ijkl'[:rank]
+    subscripts = ','.join(f'n{target}{letter}' for target, letter in zip(targets, letters))
+    lab = contract(f'{subscripts},{letters}->n{targets}', *([rotations] * rank), chi)
+    return lab.reshape(rotations.shape[0], -1)
+
+def element_values(labels: Tuple[str, ...], elements: Union[Dict[str, float], None]=None) -> np.ndarray:
+    elements = elements or {}
+    unknown = set(elements) - set(labels)
+    if unknown:
+        raise ValueError(f"{', '.join(sorted(unknown))} not independent elements, the group allows: {', '.join(labels)}")
+    return np.array([float(elements.get(label, 1.0)) for label in labels])
+
+def susceptibility(point_group: str, source: str, elements: Union[Dict[str, float], None]=None) -> np.ndarray:
+    #Built from the reduced parameter vector, the symmetry analysis itself comes precomputed from the reduction table
+    reduction = get_reduction(point_group, source)
+    if not reduction.labels:
+        raise ValueError(f"{source} SHG is forbidden in {reduction.point_group}")
+    return expand_tensor(reduction, element_values(tuple(reduction.labels), elements))
+
+def field_weights(source: str, geometry: str, channels: List[str], theta: np.ndarray) -> np.ndarray:
+    #Outer products of the lab frame fields for every channel and angle of incidence, (C, T, 3**rank).
+    #The SHG amplitude is then these weights dotted with the lab frame tensor, a single matrix product over the azimuths
+    unknown = [channel for channel in channels if channel not in CHANNEL_POLARIZATIONS[geometry]]
+    if unknown:
+        raise ValueError(f"No {', '.join(unknown)} channel in {geometry} geometry")
+    weights = []
+    for angle in theta:
+        beam = beam_vectors(geometry, angle)
+        for pol_in, pol_out in (CHANNEL_POLARIZATIONS[geometry][channel] for channel in channels):
+            e_in, e_out = beam['in'][pol_in], beam['out'][pol_out]
+            if source == 'e_d': #e_out · χ:E E
+                weights.append(np.einsum('i,j,k->ijk', e_out, e_in, e_in))
+            elif source == 'e_q': #e_out · χ:E k E, the factor i of the gradient drops out of the intensity
+                weights.append(np.einsum('i,j,k,l->ijkl', e_out, e_in, beam['k_in'], e_in))
+            elif source == 'm_d': #e_out · (k_out x M) = M · (e_out x k_out)
+                weights.append(np.einsum('i,j,k->ijk', np.cross(e_out, beam['k_out']), e_in, e_in))
+            else:
+                raise ValueError(f"Unknown source '{source}', use e_d, e_q or m_d")
+    weights = np.array(weights).reshape(len(theta), len(channels), -1)
+    return np.ascontiguousarray(weights.transpose(1, 0, 2))
+
+def basis_amplitudes(point_group: str, source: str, geometry: str, channels: List[str], theta: np.ndarray,
+                     phi: np.ndarray, plane: str='001') -> np.ndarray:
+    #SHG amplitude of each independent element on its own, (C, T, N, M) with theta in degrees and phi in radians.
+    #The amplitude is linear in the elements, so any element values v give the intensity (amplitudes @ v) ** 2
+    theta = np.radians(np.atleast_1d(np.asarray(theta, dtype=np.float64)))
+    phi = np.atleast_1d(np.asarray(phi, dtype=np.float64))
+    basis, labels = tensor_basis(point_group, source)
+    if not labels:
+        raise ValueError(f"{source} SHG is forbidden in {normalize_point_group(point_group)}")
+    weights = field_weights(source, geometry, channels, theta).reshape(len(channels) * theta.size, -1)
+    rotations = rotation_stack(phi + np.radians(PLANE_ROTATIONS[plane]))
+    lab = np.stack([rotated_tensors(tensor, rotations) for tensor in basis], axis=-1)
+    return contract('wk,nkm->wnm', weights, lab).reshape(len(channels), theta.size, phi.size, len(labels))
+
+def azimuth_chunk(num_channels: int, num_theta: int, rank: int, max_bytes: int) -> int:
+    #Azimuths per chunk so the rotation stack, the rotated tensors and the intensity block fit in max_bytes
+    per_azimuth = 8 * (9 + 3 ** rank + 2 * num_channels * num_theta)
+    return max(1, int(max_bytes // per_azimuth))
+
+def iter_intensity_chunks(point_group: str, source: str, geometry: str, channels: List[str], theta: np.ndarray,
+                          phi: np.ndarray, plane: str='001', elements: Union[Dict[str, float], None]=None,
+                          max_bytes: int=SIM_MEMORY_BUDGET) -> Iterator[Tuple[slice, np.ndarray]]:
+    #Yields (azimuth slice, intensity (C, T, chunk)), theta in degrees and phi in radians
+    theta = np.radians(np.atleast_1d(np.asarray(theta, dtype=np.float64)))
+    phi = np.atleast_1d(np.asarray(phi, dtype=np.float64))
+    chi = susceptibility(point_group, source, elements)
+    weights = field_weights(source, geometry, channels, theta).reshape(len(channels) * theta.size, -1)
+    start = np.radians(PLANE_ROTATIONS[plane]) #Starting orientation of the crystal axes, added to every azimuth
+    step = azimuth_chunk(len(channels), theta.size, chi.ndim, max_bytes)
+    for first in range(0, phi.size, step):
+        chunk = slice(first, min(first + step, phi.size))
+        lab = rotated_tensors(chi, rotation_stack(phi[chunk] + start))
+        amplitude = weights @ lab.T
+        np.square(amplitude, out=amplitude)
+        yield chunk, amplitude.reshape(len(channels), theta.size, -1)
+
+def simulate_map(point_group: str, source: str, geometry: str, channels: List[str], theta: np.ndarray, phi: np.ndarray,
+                 plane: str='001', elements: Union[Dict[str, float], None]=None,
+                 max_bytes: int=SIM_MEMORY_BUDGET) -> Dict[str, np.ndarray]:
+    #SHG intensity over a (θ, φ) grid, one (T, N) array per channel
+    theta = np.atleast_1d(np.asarray(theta, dtype=np.float64))
+    phi = np.atleast_1d(np.asarray(phi, dtype=np.float64))
+    intensity = np.empty((len(channels), theta.size, phi.size))
+    for chunk, block in iter_intensity_chunks(point_group, source, geometry, channels, theta, phi, plane, elements, max_bytes):
+        intensity[:, :, chunk] = block
+    return {channel: intensity[i] for i, channel in enumerate(channels)}
+
+@METRICS.timed('simulation_seconds')
+def simulate_channels(point_group: str, source: str, geometry: str, channels: List[str], phi: np.ndarray,
+                      theta: Union[float, None]=None, plane: str='001',
+                      elements: Union[Dict[str, float], None]=None) -> Dict[str, np.ndarray]:
+    #SHG intensity of every channel over the azimuths phi (radians) at one angle of incidence (degrees)
+    theta = DEFAULT_INCIDENCE[geometry] if theta is None else theta
+    intensity = simulate_map(point_group, source, geometry, channels, [theta], phi, plane, elements)
+    return {channel: values[0] for channel, values in intensity.items()}
+
+def simulate(config: SimConfig) -> Dict[str, ChannelData]:
+    channels = config.channels or list(CHANNEL_POLARIZATIONS[config.geometry])
+    phi = np.linspace(0, 2 * np.pi, config.num_points, endpoint=False)
+    intensity = simulate_channels(config.point_group, config.source, config.geometry, channels, phi,
+                                  theta=config.theta, plane=config.plane, elements=config.elements)
+    return {channel: ChannelData(phi=phi, r=intensity[channel]) for channel in channels}
+
+def crystal_point_group(crystal: Dict) -> str:
+    #The crystal files store the point group under space_group, written without underscores (C1, C2v, Td)
+    return normalize_point_group(str(crystal['space_group']))
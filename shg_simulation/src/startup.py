@@ -1,10 +1,38 @@
-import pkg_resources
+import sys
+import time
+START_TIME = time.perf_counter()
+import argparse
 
-from .sys_config import OS_CONFIG
-from .shg_gui import init_gui
+from .profiling import StartupProfiler
+#Import tracing has to be switched on before the imports below, so the flag is checked ahead of argument parsing
+PROFILER = StartupProfiler(START_TIME, trace_imports=any(arg == '--profile-startup' or arg.startswith('--profile-startup=')
+                                                         for arg in sys.argv))
+
+from .sys_config import OS_CONFIG, package_version
 from .check_repo_files import check_files, pull_missing_files
+from .cache import DATA_CACHE, FIT_DISK_CACHE
+from .model_registry import MODEL_REGISTRY
+from .metrics import METRICS
+
+#Heavy dependencies that should only load once the feature using them is opened
+DEFERRED_MODULES = ('mp_api', 'git', 'requests', 'pandas', 'scipy')
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='shg_gui')
+    parser.add_argument('--startup-time', action='store_true', help='print how long each startup phase took')
+    parser.add_argument('--profile-startup', nargs='?', const='startup_profile.json', default=None, metavar='PATH',
+                        help='write phase times, per-module import times and peak memory as json (default: startup_profile.json)')
+    parser.add_argument('--metrics', default=None, metavar='PATH',
+                        help='record load/fit/plot timings for the session and write them on exit (.json, otherwise Prometheus text)')
+    return parser
 
 def main():
+    args, qt_args = create_parser().parse_known_args()
+    sys.argv = sys.argv[:1] + qt_args #Qt gets whatever is left
+    if args.metrics:
+        METRICS.enable(export_path=args.metrics)
+    PROFILER.mark('imports')
+
     all_files = check_files()
     if isinstance(all_files, str):
         print(f"Missing the following project files:{all_files}")
@@ -16,9 +44,26 @@ def main():
                 break 
             elif user_input == 'q':
                 return
+    PROFILER.mark('check_files')
     OS_CONFIG.set_config()
     if OS_CONFIG.invalid_os == True: #Test to see if the os is valid before starting application, kills script if it is invalid
-        print(f"Version {pkg_resources.get_distribution('shg_simulation').version} of SHG Simulation Package is not supported on this operating system.")
+        print(f"Version {package_version()} of SHG Simulation Package is not supported on this operating system.")
         print("Supported operating systems: Windows, macOS, and Linux.")
         return
-    init_gui()
+    DATA_CACHE.set_max_bytes(OS_CONFIG.data_cache_mb * 1024 ** 2)
+    FIT_DISK_CACHE.set_max_bytes(OS_CONFIG.fit_disk_cache_mb * 1024 ** 2)
+    MODEL_REGISTRY.disk.set_max_bytes(OS_CONFIG.model_disk_cache_mb * 1024 ** 2)
+    PROFILER.mark('set_config')
+    from .shg_gui import init_gui #PyQt6 and matplotlib's Qt backend are only loaded once the checks above pass
+    PROFILER.mark('gui imports')
+
+    def window_shown():
+        PROFILER.mark('first paint')
+        PROFILER.stop_tracing()
+        if args.startup_time:
+            print(PROFILER.summary(DEFERRED_MODULES))
+        if args.profile_startup:
+            print(f"Startup profile written to {PROFILER.dump(args.profile_startup, package_version(), DEFERRED_MODULES)}")
+
+    profiling = args.startup_time or args.profile_startup
+    init_gui(on_shown=window_shown if profiling else None, mark=PROFILER.mark if profiling else None)
@@ -0,0 +1,282 @@
+import os
+import csv
+import json
+import uuid
+import yaml
+import hashlib
+import pathlib
+import itertools
+import numpy as np
+from dataclasses import asdict, fields
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Tuple, Dict, Union, Callable, Iterator
+
+from .sys_config import OS_CONFIG, PACKAGE_DIR
+from .data_classes import SweepSpec
+from .utils import read_crystal_file
+from .symmetry import SOURCES, get_reduction, definitions_digest
+from .simulation import (
+    CHANNEL_POLARIZATIONS, DEFAULT_INCIDENCE, PLANE_ROTATIONS, basis_amplitudes, element_values, contract, crystal_point_group
+)
+from .metrics import METRICS
+
+SWEEP_VERSION = 1
+SWEEP_DTYPES = ['float64', 'float32']
+MANIFEST_NAME = 'manifest.json'
+POINTS_NAME = 'points.csv'
+POINT_COLUMNS = ['index', 'crystal', 'point_group', 'source', 'plane', 'theta']
+IN_FLIGHT_PER_WORKER = 2 #Chunks queued per process, bounds the memory held by finished but unwritten results
+
+def grid_values(value: Union[List, Dict, float]) -> List[float]:
+    #A list of values, one value, or {start, stop, num} for evenly spaced values with both ends included
+    if isinstance(value, dict):
+        return [float(v) for v in np.linspace(float(value['start']), float(value['stop']), int(value['num']))]
+    if isinstance(value, (list, tuple)):
+        return [float(v) for v in value]
+    return [float(value)]
+
+def validate_spec(spec: SweepSpec) -> None:
+    if spec.geometry not in CHANNEL_POLARIZATIONS:
+        raise ValueError(f"Unknown geometry '{spec.geometry}', use refl or trans")
+    unknown = [channel for channel in spec.channels if channel not in CHANNEL_POLARIZATIONS[spec.geometry]]
+    if unknown:
+        raise ValueError(f"No {', '.join(unknown)} channel in {spec.geometry} geometry")
+    unknown = [plane for plane in spec.planes if plane not in PLANE_ROTATIONS]
+    if unknown:
+        raise ValueError(f"Unknown plane {', '.join(unknown)}, use {' or '.join(PLANE_ROTATIONS)}")
+    unknown = [source for source in spec.sources if source not in SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown source {', '.join(unknown)}, use e_d, e_q or m_d")
+    if spec.dtype not in SWEEP_DTYPES:
+        raise ValueError(f"Unknown dtype '{spec.dtype}', use {' or '.join(SWEEP_DTYPES)}")
+    if spec.num_points < 1 or spec.chunk_points < 1:
+        raise ValueError("num_points and chunk_points have to be positive")
+
+def load_sweep_spec(file_path: Union[pathlib.Path, str]) -> SweepSpec:
+    #YAML (or JSON) mapping of SweepSpec fields, theta and every element take grid_values forms.
+    #Relative crystal files are resolved against the spec's own directory
+    file_path = pathlib.Path(file_path)
+    with open(file_path, 'r') as file:
+        data = yaml.safe_load(file) or {}
+    if not isinstance(data, dict):
+        raise ValueError(f"{file_path} is not a mapping of sweep settings")
+    unknown = set(data) - {spec_field.name for spec_field in fields(SweepSpec)}
+    if unknown:
+        raise ValueError(f"Unknown sweep setting {', '.join(sorted(unknown))}")
+    for key in ['crystal_files', 'crystals', 'sources', 'channels', 'planes']:
+        if key in data and isinstance(data[key], str):
+            data[key] = [data[key]]
+    if 'theta' in data:
+        data['theta'] = grid_values(data['theta'])
+    if 'elements' in data:
+        data['elements'] = {str(label): grid_values(values) for label, values in (data['elements'] or {}).items()}
+    data['crystal_files'] = [str(file_path.parent / path) for path in data.get('crystal_files', [])]
+    #An unquoted 001 loads as the integer 1
+    data['planes'] = [f'{plane:03d}' if isinstance(plane, int) else str(plane) for plane in data.get('planes', ['001'])]
+    spec = SweepSpec(**data)
+    validate_spec(spec)
+    return spec
+
+def default_crystal_file() -> str:
+    #Same list the gui shows, the user's edited copy once one exists
+    custom = f'{PACKAGE_DIR}/data/custom_crystals.yaml'
+    return custom if pathlib.Path(custom).exists() else f'{PACKAGE_DIR}/data/default_crystals.yaml'
+
+def sweep_crystals(spec: SweepSpec) -> List[Tuple[str, str]]:
+    #(crystal label, point group) of every crystal in the sweep
+    crystals = []
+    matched = set()
+    for file_path in spec.crystal_files or [default_crystal_file()]:
+        for crystal in read_crystal_file(file_path=file_path) or []:
+            label = f'{crystal["name"]} ({crystal["symbol"]})'
+            names = {label, str(crystal['name']), str(crystal['symbol'])}
+            if spec.crystals and not names & set(spec.crystals):
+                continue
+            matched.update(names & set(spec.crystals))
+            crystals.append((label, crystal_point_group(crystal)))
+    missing = [name for name in spec.crystals if name not in matched]
+    if missing:
+        raise ValueError(f"No crystal named {', '.join(missing)}")
+    return crystals
+
+def sweep_channels(spec: SweepSpec) -> List[str]:
+    return spec.channels or list(CHANNEL_POLARIZATIONS[spec.geometry])
+
+def iter_points(spec: SweepSpec, crystals: List[Tuple[str, str]]) -> Iterator[Tuple]:
+    #(crystal, point group, source, plane, theta, swept element values) in storage order. Only the swept elements a group
+    #has as independent elements are varied for it, and sources a group forbids are skipped
+    thetas = spec.theta or [DEFAULT_INCIDENCE[spec.geometry]]
+    for crystal, point_group in crystals:
+        for source in spec.sources:
+            labels = get_reduction(point_group, source).labels
+            if not labels:
+                continue
+            swept = [label for label in spec.elements if label in labels]
+            for plane, theta in itertools.product(spec.planes, thetas):
+                for values in itertools.product(*[spec.elements[label] for label in swept]):
+                    yield crystal, point_group, source, plane, theta, tuple(zip(swept, values))
+
+def count_points(spec: SweepSpec, crystals: List[Tuple[str, str]]) -> int:
+    total = 0
+    for _, point_group in crystals:
+        for source in spec.sources:
+            labels = get_reduction(point_group, source).labels
+            if labels:
+                sizes = [len(values) for label, values in spec.elements.items() if label in labels]
+                total = total + len(spec.planes) * len(spec.theta or [0]) * int(np.prod(sizes, dtype=np.int64))
+    return total
+
+def sweep_digest(spec: SweepSpec, crystals: List[Tuple[str, str]]) -> str:
+    #A store is only resumed by the sweep that started it, same grid, crystals and symmetry definitions
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([SWEEP_VERSION, asdict(spec), crystals, definitions_digest()], sort_keys=True).encode())
+    return digest.hexdigest()
+
+def _simulate_chunk(geometry: str, channels: List[str], num_points: int, dtype: str,
+                    points: List[Tuple[str, str, str, float, Tuple[float, ...]]]) -> np.ndarray:
+    #Intensity (P, C, N) of one chunk. Points sharing a group, source and plane share their per element amplitudes,
+    #every scan is then one product with its element values
+    phi = np.linspace(0, 2 * np.pi, num_points, endpoint=False)
+    result = np.empty((len(points), len(channels), num_points), dtype=dtype)
+    groups = {}
+    for i, (point_group, source, plane, theta, values) in enumerate(points):
+        groups.setdefault((point_group, source, plane), {}).setdefault(theta, []).append((i, values))
+    for (point_group, source, plane), by_theta in groups.items():
+        thetas = list(by_theta)
+        amplitudes = basis_amplitudes(point_group, source, geometry, channels, thetas, phi, plane)
+        for t, theta in enumerate(thetas):
+            index = [i for i, _ in by_theta[theta]]
+            values = np.array([values for _, values in by_theta[theta]])
+            block = contract('cnm,pm->pcn', amplitudes[:, t], values)
+            result[index] = np.square(block, out=block)
+    return result
+
+class SweepStore:
+    #Directory of chunk_<index>.npy arrays (points, channels, azimuths) with a manifest and a points table.
+    #Chunks are renamed into place once complete, so the chunk files present are exactly the finished work
+    def __init__(self, directory: Union[pathlib.Path, str]):
+        self.directory = pathlib.Path(directory)
+        self.manifest = None
+
+    def chunk_path(self, index: int) -> pathlib.Path:
+        return self.directory / f'chunk_{index:06d}.npy'
+
+    def load_manifest(self) -> Union[Dict, None]:
+        try:
+            with open(self.directory / MANIFEST_NAME, 'r') as file:
+                self.manifest = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            self.manifest = None
+        return self.manifest
+
+    def create(self, spec: SweepSpec, crystals: List[Tuple[str, str]], digest: str, total: int) -> None:
+        if self.load_manifest() is not None:
+            if self.manifest.get('digest') != digest:
+                raise ValueError(f"{self.directory} holds a different sweep, use a new output directory")
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        swept = list(spec.elements)
+        self.atomic_write(POINTS_NAME, lambda file: self.write_points(file, spec, crystals, swept), text=True)
+        np.save(self.directory / 'phi.npy', np.linspace(0, 2 * np.pi, spec.num_points, endpoint=False))
+        self.manifest = {'version': SWEEP_VERSION, 'digest': digest, 'spec': asdict(spec), 'channels': sweep_channels(spec),
+                         'num_points': spec.num_points, 'total_points': total, 'chunk_points': spec.chunk_points,
+                         'num_chunks': -(-total // spec.chunk_points), 'dtype': spec.dtype, 'elements': swept}
+        self.atomic_write(MANIFEST_NAME, lambda file: json.dump(self.manifest, file, indent=2), text=True)
+
+    def write_points(self, file, spec: SweepSpec, crystals: List[Tuple[str, str]], swept: List[str]) -> None:
+        writer = csv.writer(file)
+        writer.writerow(POINT_COLUMNS + swept)
+        for index, (crystal, point_group, source, plane, theta, values) in enumerate(iter_points(spec, crystals)):
+            values = dict(values)
+            writer.writerow([index, crystal, point_group, source, plane, theta] + [values.get(label, '') for label in swept])
+
+    def atomic_write(self, name: str, write: Callable, text: bool=False) -> None:
+        temp_path = self.directory / f'.{name}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w' if text else 'wb', **({'newline': ''} if text else {})) as file:
+            write(file)
+        os.replace(temp_path, self.directory / name)
+
+    def completed(self) -> List[int]:
+        return [index for index in range(self.manifest['num_chunks']) if self.chunk_path(index).exists()]
+
+    def write_chunk(self, index: int, intensity: np.ndarray) -> None:
+        self.atomic_write(self.chunk_path(index).name, lambda file: np.save(file, intensity))
+
+    def read_chunk(self, index: int, mmap: bool=True) -> np.ndarray:
+        return np.load(self.chunk_path(index), mmap_mode='r' if mmap else None)
+
+    def iter_chunks(self, mmap: bool=True) -> Iterator[Tuple[int, np.ndarray]]:
+        #(index of the first point, intensity) for every finished chunk
+        for index in self.completed():
+            yield index * self.manifest['chunk_points'], self.read_chunk(index, mmap)
+
+    def read_points(self):
+        import pandas as pd #Deferred like the other result writers, sweeps can be run without reading them back
+        return pd.read_csv(self.directory / POINTS_NAME, dtype={'plane': str})
+
+def open_sweep(directory: Union[pathlib.Path, str]) -> SweepStore:
+    store = SweepStore(directory)
+    if store.load_manifest() is None:
+        raise ValueError(f"No sweep in {directory}")
+    return store
+
+def iter_chunk_points(spec: SweepSpec, crystals: List[Tuple[str, str]], skip: set) -> Iterator[Tuple[int, List[Tuple]]]:
+    #(chunk index, points in worker form) for every chunk not in skip, the grid is walked once and never held in memory
+    points = iter_points(spec, crystals)
+    labels = {}
+    for index in itertools.count():
+        block = list(itertools.islice(points, spec.chunk_points))
+        if not block:
+            return
+        if index in skip:
+            continue
+        chunk = []
+        for _, point_group, source, plane, theta, values in block:
+            if (point_group, source) not in labels:
+                labels[(point_group, source)] = tuple(get_reduction(point_group, source).labels)
+            chunk.append((point_group, source, plane, theta, tuple(element_values(labels[(point_group, source)], dict(values)))))
+        yield index, chunk
+
+def run_sweep(spec: SweepSpec, directory: Union[pathlib.Path, str], max_workers: Union[int, None]=None,
+              callback: Union[Callable[[int, int], None], None]=None) -> SweepStore:
+    #Simulates every grid point into a SweepStore, skipping chunks an earlier (interrupted) run already wrote.
+    #At most IN_FLIGHT_PER_WORKER chunks per process are pending at once, so memory does not grow with the sweep
+    validate_spec(spec)
+    crystals = sweep_crystals(spec)
+    total = count_points(spec, crystals)
+    store = SweepStore(directory)
+    store.create(spec, crystals, sweep_digest(spec, crystals), total)
+    done = set(store.completed())
+    num_chunks = store.manifest['num_chunks']
+    METRICS.count('sweep_chunks_resumed', len(done))
+    if callback is not None:
+        callback(len(done), num_chunks)
+    args = (spec.geometry, sweep_channels(spec), spec.num_points, spec.dtype)
+    chunks = iter_chunk_points(spec, crystals, done)
+    workers = max(1, int(max_workers or OS_CONFIG.fit_max_workers or os.cpu_count() or 1))
+
+    def finish(index: int, intensity: np.ndarray) -> None:
+        store.write_chunk(index, intensity)
+        done.add(index)
+        METRICS.count('sweep_chunks')
+        if callback is not None:
+            callback(len(done), num_chunks)
+
+    with METRICS.timer('sweep_seconds'):
+        if workers == 1:
+            for index, points in chunks:
+                finish(index, _simulate_chunk(*args, points))
+            return store
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending = {}
+        try:
+            for index, points in itertools.chain(chunks, [(None, None)]):
+                if index is not None:
+                    pending[executor.submit(_simulate_chunk, *args, points)] = index
+                while pending and (index is None or len(pending) >= workers * IN_FLIGHT_PER_WORKER):
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish(pending.pop(future), future.result())
+        finally:
+            executor.shutdown(cancel_futures=True)
+    return store
@@ -0,0 +1,225 @@
+import os
+import re
+import uuid
+import pickle
+import hashlib
+import itertools
+import threading
+import numpy as np
+from typing import List, Tuple, Dict, Union
+
+from .sys_config import OS_CONFIG, USER_CACHE_DIR
+from .data_classes import TensorReduction
+
+#Cartesian frame with z along the principal axis and x along a two-fold axis / in a vertical mirror plane where the group has one
+AXES = 'xyz'
+
+def rotation_z(angle: float) -> np.ndarray:
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+INVERSION = -np.eye(3)
+SIGMA_H = np.diag([1.0, 1.0, -1.0]) #Mirror normal to z
+SIGMA_V = np.diag([1.0, -1.0, 1.0]) #Mirror containing x and z
+C2_X = np.diag([1.0, -1.0, -1.0])
+C3_111 = np.array([[0.0, 0.0, 1.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]) #Cubic body diagonal
+
+def c_n(n: int) -> np.ndarray:
+    return rotation_z(2 * np.pi / n)
+
+def s_n(n: int) -> np.ndarray:
+    return SIGMA_H @ c_n(n)
+
+#Generators of the 32 crystallographic point groups (Schoenflies names as used in point_groups.yaml)
+POINT_GROUP_GENERATORS = {
+    'C_1': [], 'S_2': [INVERSION],
+    'C_2': [c_n(2)], 'C_1h': [SIGMA_H], 'C_2h': [c_n(2), SIGMA_H],
+    'D_2': [c_n(2), C2_X], 'C_2v': [c_n(2), SIGMA_V], 'D_2h': [c_n(2), C2_X, INVERSION],
+    'C_4': [c_n(4)], 'S_4': [s_n(4)], 'C_4h': [c_n(4), SIGMA_H], 'D_4': [c_n(4), C2_X], 'C_4v': [c_n(4), SIGMA_V],
+    'D_2d': [s_n(4), C2_X], 'D_4h': [c_n(4), C2_X, INVERSION],
+    'C_3': [c_n(3)], 'S_6': [c_n(3), INVERSION], 'D_3': [c_n(3), C2_X], 'C_3v': [c_n(3), SIGMA_V],
+    'D_3d': [c_n(3), C2_X, INVERSION],
+    'C_6': [c_n(6)], 'C_3h': [c_n(3), SIGMA_H], 'C_6h': [c_n(6), SIGMA_H], 'D_6': [c_n(6), C2_X], 'C_6v': [c_n(6), SIGMA_V],
+    'D_3h': [c_n(3), SIGMA_H, SIGMA_V], 'D_6h': [c_n(6), C2_X, INVERSION],
+    'T': [c_n(2), C2_X, C3_111], 'T_h': [c_n(2), C2_X, C3_111, INVERSION], 'O': [c_n(4), C3_111],
+    'T_d': [s_n(4), C3_111], 'O_h': [c_n(4), C3_111, INVERSION],
+}
+POINT_GROUP_ALIASES = {'C_i': 'S_2', 'C_s': 'C_1h', 'C_3i': 'S_6'}
+
+#rank: tensor rank, axial: picks up det(R) under improper operations,
+#symmetric: index pairs the tensor is symmetric in (the two fundamental fields)
+SOURCE_TENSORS = {
+    'e_d': {'rank': 3, 'axial': False, 'symmetric': [(1, 2)]}, #P_i = χ_ijk E_j E_k
+    'e_q': {'rank': 4, 'axial': False, 'symmetric': [(1, 3)]}, #P_i = χ_ijkl E_j ∇_k E_l
+    'm_d': {'rank': 3, 'axial': True, 'symmetric': [(1, 2)]}, #M_i = χ_ijk E_j E_k
+}
+SOURCES = list(SOURCE_TENSORS)
+ZERO_TOL = 1e-10
+SYMMETRY_CACHE_DIR = f'{USER_CACHE_DIR}/symmetry'
+SYMMETRY_VERSION = 1
+
+def normalize_point_group(name: str) -> str:
+    #Crystal files write C1, C1h, Td, ... the package uses C_1, C_1h, T_d
+    name = name.strip()
+    match = re.fullmatch(r'([CDSTO])_?(\d*)([a-z]*)', name)
+    if match is not None:
+        letter, order, suffix = match.groups()
+        name = f'{letter}_{order}{suffix}' if order or suffix else letter
+    name = POINT_GROUP_ALIASES.get(name, name)
+    if name not in POINT_GROUP_GENERATORS:
+        raise ValueError(f"Unknown point group '{name}'")
+    return name
+
+def element_label(index: Tuple[int, ...]) -> str:
+    return ''.join(AXES[i] for i in index)
+
+def tensor_transform(matrix: np.ndarray, rank: int) -> np.ndarray:
+    #Action of a 3x3 operation on the flattened rank-n tensor, the n-fold Kronecker power
+    result = np.ones((1, 1))
+    for _ in range(rank):
+        result = np.kron(result, matrix)
+    return result
+
+def permutation_matrix(rank: int, pair: Tuple[int, int]) -> np.ndarray:
+    size = 3 ** rank
+    matrix = np.zeros((size, size))
+    for flat, index in enumerate(itertools.product(range(3), repeat=rank)):
+        swapped = list(index)
+        swapped[pair[0]], swapped[pair[1]] = swapped[pair[1]], swapped[pair[0]]
+        matrix[flat, np.ravel_multi_index(swapped, (3,) * rank)] = 1.0
+    return matrix
+
+def reduced_row_echelon(matrix: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+    #Rows end up with a 1 in their pivot column and zeros in every other row's pivot, so each pivot is an independent element
+    matrix = matrix.copy()
+    pivots = []
+    row = 0
+    for column in range(matrix.shape[1]):
+        if row == matrix.shape[0]:
+            break
+        best = row + int(np.argmax(np.abs(matrix[row:, column])))
+        if abs(matrix[best, column]) < ZERO_TOL:
+            continue
+        matrix[[row, best]] = matrix[[best, row]]
+        matrix[row] = matrix[row] / matrix[row, column]
+        others = np.arange(matrix.shape[0]) != row
+        matrix[others] = matrix[others] - np.outer(matrix[others, column], matrix[row])
+        pivots.append(column)
+        row = row + 1
+    matrix = np.round(matrix[:row], 12) #Symmetry relations are simple ratios, this drops the elimination round off
+    matrix[np.abs(matrix) < ZERO_TOL] = 0.0
+    return matrix, pivots
+
+def reduce_tensor(point_group: str, source: str) -> TensorReduction:
+    #A tensor invariant under the group satisfies (det(R)^axial R⊗...⊗R - 1) χ = 0 for every generator R,
+    #the null space of those constraints in echelon form pins each free direction to one independent element
+    spec = SOURCE_TENSORS[source]
+    rank = spec['rank']
+    size = 3 ** rank
+    constraints = [permutation_matrix(rank, pair) - np.eye(size) for pair in spec['symmetric']]
+    for generator in POINT_GROUP_GENERATORS[point_group]:
+        sign = np.linalg.det(generator) if spec['axial'] else 1.0
+        constraints.append(sign * tensor_transform(generator, rank) - np.eye(size))
+    constraints = np.vstack(constraints)
+    _, singular, vt = np.linalg.svd(constraints)
+    null_space = vt[np.sum(singular > ZERO_TOL * max(singular.max(), 1.0)):]
+    if null_space.shape[0] == 0:
+        return TensorReduction(point_group=point_group, source=source, rank=rank, coefficients=np.zeros((size, 0)))
+    rows, pivots = reduced_row_echelon(null_space)
+    return TensorReduction(point_group=point_group, source=source, rank=rank,
+                           labels=[element_label(np.unravel_index(pivot, (3,) * rank)) for pivot in pivots],
+                           coefficients=np.ascontiguousarray(rows.T))
+
+def definitions_digest() -> str:
+    #Cached tables are only reused while the group and source definitions they were built from are unchanged
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(SYMMETRY_VERSION).encode())
+    for name, generators in sorted(POINT_GROUP_GENERATORS.items()):
+        digest.update(name.encode())
+        for generator in generators:
+            digest.update(np.round(generator, 12).tobytes())
+    digest.update(repr(sorted(SOURCE_TENSORS.items())).encode())
+    return digest.hexdigest()
+
+class ReductionTable:
+    def __init__(self, cache_dir: str=SYMMETRY_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.reductions = None #(point group, source) -> TensorReduction
+        self.lock = threading.Lock()
+
+    def get(self, point_group: str, source: str) -> TensorReduction:
+        if source not in SOURCE_TENSORS:
+            raise ValueError(f"Unknown source '{source}', use e_d, e_q or m_d")
+        point_group = normalize_point_group(point_group)
+        if self.reductions is None:
+            self.load()
+        return self.reductions[(point_group, source)]
+
+    def load(self) -> None:
+        #The whole table is built in one go the first time (~0.2s), every later start reads it back from disk
+        with self.lock:
+            if self.reductions is not None:
+                return
+            file_path = f'{self.cache_dir}/reductions_{definitions_digest()}.pkl'
+            reductions = self.read_cache(file_path)
+            if reductions is None:
+                reductions = {(point_group, source): reduce_tensor(point_group, source)
+                              for point_group in POINT_GROUP_GENERATORS for source in SOURCE_TENSORS}
+                self.write_cache(file_path, reductions)
+            for reduction in reductions.values():
+                reduction.coefficients.setflags(write=False) #Shared by every caller
+            self.reductions = reductions
+
+    def read_cache(self, file_path: str) -> Union[Dict[Tuple[str, str], TensorReduction], None]:
+        if not OS_CONFIG.fit_disk_cache:
+            return None
+        try:
+            with open(file_path, 'rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.PickleError, EOFError, AttributeError):
+            return None
+
+    def write_cache(self, file_path: str, reductions: Dict[Tuple[str, str], TensorReduction]) -> None:
+        if not OS_CONFIG.fit_disk_cache:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f'{file_path}.{uuid.uuid4().hex}.tmp'
+            with open(temp_path, 'wb') as file:
+                pickle.dump(reductions, file)
+            os.replace(temp_path, file_path)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        with self.lock:
+            self.reductions = None
+
+REDUCTION_TABLE = ReductionTable()
+
+def get_reduction(point_group: str, source: str) -> TensorReduction:
+    return REDUCTION_TABLE.get(point_group, source)
+
+def tensor_basis(point_group: str, source: str) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    #Basis tensors spanning every susceptibility the group allows, with the label of the element each one is pinned to
+    reduction = get_reduction(point_group, source)
+    return reduction.coefficients.T.reshape((-1,) + (3,) * reduction.rank), tuple(reduction.labels)
+
+def expand_tensor(reduction: TensorReduction, values: np.ndarray) -> np.ndarray:
+    #Full susceptibility from the reduced parameter vector, values are in the order of reduction.labels
+    return (reduction.coefficients @ np.asarray(values, dtype=np.float64)).reshape((3,) * reduction.rank)
+
+def allowed_sources(point_group: str) -> List[str]:
+    #Sources the group leaves any tensor element for, electric dipole SHG for one vanishes with inversion symmetry
+    return [source for source in SOURCES if get_reduction(point_group, source).labels]
+
+def nonzero_elements(point_group: str, source: str) -> Dict[str, List[Tuple[float, str]]]:
+    #Every nonzero tensor element as a combination of the independent ones, e.g. {'yyz': [(1.0, 'xxz')]}
+    reduction = get_reduction(point_group, source)
+    elements = {}
+    for flat, index in enumerate(itertools.product(range(3), repeat=reduction.rank)):
+        terms = [(float(coefficient), reduction.labels[m]) for m, coefficient in enumerate(reduction.coefficients[flat])
+                 if coefficient != 0]
+        if terms:
+            elements[element_label(index)] = terms
+    return elements
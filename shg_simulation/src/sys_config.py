@@ -1,10 +1,24 @@
+import os
 import yaml
 import platform
 import pathlib
+from importlib import metadata
 
 REPO_DIR = pathlib.Path(__file__).parent.parent.parent.resolve()
 PACKAGE_DIR = pathlib.Path(__file__).parent.parent.resolve()
 
+def user_cache_dir() -> pathlib.Path:
+    #Per user location for files written at run time, an installed package directory may be read only or shared
+    if platform.system() == 'Windows':
+        base = os.environ.get('LOCALAPPDATA') or pathlib.Path.home() / 'AppData' / 'Local'
+    elif platform.system() == 'Darwin':
+        base = pathlib.Path.home() / 'Library' / 'Caches'
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(base) / 'shg_simulation'
+
+USER_CACHE_DIR = user_cache_dir()
+
 class OSConfig:
     def __init__(self):
         self.os = platform.system()
@@ -14,6 +28,12 @@ class OSConfig:
         self.fit_res_mini_plt_r = 0
         self.full_plt_dpi = 0
         self.full_plt_len = 0
+        self.fit_max_workers = 0
+        self.data_cache_mb = 512
+        self.fit_disk_cache = True
+        self.fit_disk_cache_mb = 256
+        self.model_disk_cache_mb = 64
+        self.selection_highlight = 'ring'
         self.invalid_os = False
         self.style_sheet = ''
 
@@ -35,9 +55,21 @@ class OSConfig:
         self.fit_res_mini_plt_r = config['fit_res_mini_plt_r']
         self.full_plt_dpi = config['full_plt_dpi']
         self.full_plt_len = config['full_plt_len']
+        self.fit_max_workers = config.get('fit_max_workers', 0) #0 uses every available core
+        self.data_cache_mb = config.get('data_cache_mb', 512)
+        self.fit_disk_cache = config.get('fit_disk_cache', True)
+        self.fit_disk_cache_mb = config.get('fit_disk_cache_mb', 256)
+        self.model_disk_cache_mb = config.get('model_disk_cache_mb', 64)
+        self.selection_highlight = config.get('selection_highlight', 'ring') #'ring' or 'glow'
 
         with open(styles_path, 'r') as file:
             self.style_sheet = file.read() 
         file.close()
 
+def package_version() -> str:
+    try:
+        return metadata.version('shg_simulation')
+    except metadata.PackageNotFoundError: #Running from a checkout that was never installed
+        return 'unknown'
+
 OS_CONFIG = OSConfig()
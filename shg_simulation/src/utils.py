@@ -1,16 +1,20 @@
 import pathlib
 import yaml
-import pandas as pd
-import requests
 import numpy as np
 import os
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from typing import List, Tuple, Union, Dict
-from mp_api.client import MPRester
 
 from .sys_config import PACKAGE_DIR, REPO_DIR
+from .data_classes import DataLoadResult, ChannelData
+from .session import is_session_file, load_session_channel
+from .cache import DATA_CACHE, data_cache_key, channel_nbytes, freeze_channel
+from .lod import scatter_points
+from .metrics import METRICS
     
+#mp_api, requests and pandas are imported where they are used, each adds noticeably to startup time
 def search_api(crystal:str):
+    from mp_api.client import MPRester
     with open(f'{PACKAGE_DIR}/configs/materials_project_api_key.txt', 'w') as file:
         api_key = file.read()
     file.close()
@@ -20,6 +24,7 @@ def search_api(crystal:str):
     #return materials
 
 def test_api_key(key=None) -> bool:
+    from mp_api.client import MPRester
     file_path = f'{PACKAGE_DIR}/configs/materials_project_api_key.txt'
     if not key:
         if not pathlib.Path(file_path).exists():
@@ -39,6 +44,7 @@ def test_api_key(key=None) -> bool:
         return False
 
 def check_internet_connection() -> bool:
+    import requests
     try:
         response = requests.get("https://www.google.com", timeout=5)
         if response.status_code == 200:
@@ -57,32 +63,63 @@ def remove_crystal(crystal_name: str, file_path_to_read: pathlib.Path, file_path
         yaml.dump(updated_data, file)
     file.close()
 
+def find_crystal(crystal_name: str, file_path: pathlib.Path) -> Union[Dict, None]:
+    for crystal in read_crystal_file(file_path=file_path):
+        if f'{crystal["name"]} ({crystal["symbol"]})' == crystal_name:
+            return crystal
+    return None
+
 def read_crystal_file(file_path: pathlib.Path) -> List[Dict]:
     with open(file_path, 'r') as file:
         data = yaml.safe_load(file)
     file.close()
     return data
 
-def read_data(data_path: pathlib.Path, header: bool) -> Union[List[Tuple[float, float]], str]: 
+def load_data(data_path: pathlib.Path, header: bool, dtype: np.dtype=np.float64, channel: Union[str, None]=None) -> DataLoadResult:
+    if is_session_file(data_path): #Binary sessions are memory mapped, the header flag does not apply
+        data = load_session_channel(data_path, channel)
+        if data is None:
+            return DataLoadResult(error="No data")
+        return DataLoadResult(data=data)
+    key = data_cache_key(data_path, header, dtype)
+    if key is not None:
+        result = DATA_CACHE.get(key)
+        if result is not None:
+            METRICS.count('data_cache_hits')
+            return result
+        METRICS.count('data_cache_misses')
+    result = parse_csv(data_path, header, dtype)
+    if key is not None:
+        if not result.error:
+            freeze_channel(result.data)
+        DATA_CACHE.put(key, result, channel_nbytes(result.data))
+    return result
+
+@METRICS.timed('csv_parse_seconds')
+def parse_csv(data_path: pathlib.Path, header: bool, dtype: np.dtype=np.float64) -> DataLoadResult:
+    import pandas as pd
     try:
-        if header:
-            df = pd.read_csv(data_path)
-        else:
-            df = pd.read_csv(data_path, header=None)
-        if df.shape[1] > 2:
-            return "Too many columns"
-        elif df.shape[1] < 2:
-            return "Too few columns"
-        data_list = list(zip(df.iloc[:, 0], df.iloc[:, 1]))
-        for (x,y) in data_list:
-            try:
-                if np.isnan(x) or np.isnan(y):
-                    return "Missing data elem"
-            except TypeError:
-                return "Incorrect dtype"
-        return data_list 
+        df = pd.read_csv(data_path, header=0 if header else None, engine='c')
     except pd.errors.EmptyDataError:
-        return "No data"
+        return DataLoadResult(error="No data")
+    if df.shape[1] > 2:
+        return DataLoadResult(error="Too many columns")
+    elif df.shape[1] < 2:
+        return DataLoadResult(error="Too few columns")
+    #Whole-column checks instead of testing each (phi, r) pair in python
+    if not all(pd.api.types.is_numeric_dtype(column_dtype) for column_dtype in df.dtypes):
+        return DataLoadResult(error="Incorrect dtype")
+    phi = np.ascontiguousarray(df.iloc[:, 0].to_numpy(dtype=dtype))
+    r = np.ascontiguousarray(df.iloc[:, 1].to_numpy(dtype=dtype))
+    if np.isnan(phi).any() or np.isnan(r).any():
+        return DataLoadResult(error="Missing data elem")
+    return DataLoadResult(data=ChannelData(phi=phi, r=r))
+
+def read_data(data_path: pathlib.Path, header: bool, dtype: np.dtype=np.float64, channel: Union[str, None]=None) -> Union[ChannelData, str]: 
+    result = load_data(data_path=data_path, header=header, dtype=dtype, channel=channel)
+    if result.error:
+        return result.error
+    return result.data
 
 def get_point_groups(source: str, sys: str) -> List[str]:
     e_d_point_groups = {'Triclinic': ['C_1'], 'Monoclinic': ['C_2', 'C_1h'], 'Orthorhombic': ['D_2', 'C_2v'], 'Tetragonal': ['C_4', 'S_4', 'D_4', 'C_4v', 'D_2d'], 
@@ -94,23 +131,45 @@ def get_point_groups(source: str, sys: str) -> List[str]:
     else:
         return e_q_or_m_d_point_groups[sys]
 
-def convert_to_config_str(gui_name: str) -> str:
-    name_scheme = {'||': 'Parallel', '⊥': 'Perpendicular', 'Reflection': 'refl', 'Transmission': 'trans', 
+GUI_NAME_SCHEME = {'||': 'Parallel', '⊥': 'Perpendicular', 'Reflection': 'refl', 'Transmission': 'trans', 
                    'Electric Dipole': 'e_d', 'Electric Quadrupole': 'e_q', 'Magnetic Dipole': 'm_d', 
                    '(0 0 1)': '001','Rotz(90°)': 'rotz90'}
+
+def convert_to_config_str(gui_name: str) -> str:
     try:
-        return name_scheme[f'{gui_name}']
+        return GUI_NAME_SCHEME[f'{gui_name}']
     except KeyError:
         return gui_name
 
-def polar_plot(title: str, data: List[Tuple[float, float]], width: int, height: int, dpi: int, data_color: str, fits=None):
-    r_values = [r for phi, r in data]
-    phi_values = [phi for phi, r in data]
-    fig, ax = plt.subplots(subplot_kw={'projection': 'polar'}, figsize=(width, height), dpi=dpi)
+def convert_to_gui_str(config_name: str) -> str:
+    for gui_name, name in GUI_NAME_SCHEME.items():
+        if name == config_name:
+            return gui_name
+    return config_name
+
+def plot_fit(ax, fit):
+    line, = ax.plot(fit.fit_phi, fit.fit_r, color=fit.legend.lower())
+    return line
+
+def to_channel_data(data: Union[ChannelData, np.ndarray, List[Tuple[float, float]]]) -> ChannelData:
+    if isinstance(data, ChannelData):
+        return data
+    data = np.asarray(data, dtype=np.float64).reshape(-1, 2)
+    return ChannelData(phi=np.ascontiguousarray(data[:, 0]), r=np.ascontiguousarray(data[:, 1]))
+
+@METRICS.timed('polar_plot_seconds')
+def polar_plot(title: str, data: ChannelData, width: int, height: int, dpi: int, data_color: str, fits=None, 
+               pixels: Union[float, None]=None):
+    data = to_channel_data(data)
+    #With a pixel size dense scans are drawn from their level of detail pyramid instead of point by point
+    phi_values, r_values = scatter_points(data, pixels)
+    #Plain Figure (not pyplot) so figures can be built from worker threads
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    ax = fig.add_subplot(projection='polar')
     ax.scatter(phi_values, r_values, color=data_color)
     if fits != None:
         for fit in fits:
-            ax.plot(fit.fit_phi, fit.fit_r, color=fit.legend.lower())
+            plot_fit(ax, fit)
     ax.set_title(title)
     ax.set_aspect('equal')
     return fig, ax
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import queue
+import pathlib
+import threading
+from typing import List, Dict, Tuple, Union, Callable
+
+from .fit_engine import load_fit_models
+from .fit_scheduler import FitScheduler
+from .batch import match_file, build_config, fit_rows, DEFAULT_FILE_PATTERN, GEOMETRY_CHANNELS
+
+WATCH_FORMATS = ['csv', 'jsonl']
+
+class DirectoryWatcher:
+    #Polls directories for channel files and hands back samples once their files have stopped changing
+    def __init__(self, directories: List[Union[pathlib.Path, str]], geometry: str, pattern: str=DEFAULT_FILE_PATTERN,
+                 channels: Union[List[str], None]=None, settle_time: float=2.0, group_timeout: float=60.0):
+        self.directories = [pathlib.Path(directory) for directory in directories]
+        self.geometry = geometry
+        self.pattern = pattern
+        self.channels = channels or GEOMETRY_CHANNELS[geometry] #A sample is complete once all of these have landed
+        self.settle_time = settle_time
+        self.group_timeout = group_timeout
+        self.files = {} #path -> (size, mtime_ns, time the file was last seen changing), only files still on disk
+        self.groups = {} #sample -> {channel: (path, size, mtime_ns)} of samples waiting on files, dropped once queued
+        self.fitted = {} #sample -> {channel: (path, size, mtime_ns)} it was queued with, a rewritten file is fit again
+
+    def scan(self) -> List[pathlib.Path]:
+        paths = []
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    paths.extend(pathlib.Path(entry.path) for entry in entries if entry.is_file() and entry.name.lower().endswith('.csv'))
+            except FileNotFoundError: #Removed mid run, picked up again if it comes back
+                continue
+        return paths
+
+    def prune(self, seen: set) -> None:
+        #Files that left the directories are forgotten, so memory follows what is on disk rather than how long the run is
+        for path in [path for path in self.files if path not in seen]:
+            del self.files[path]
+        for table in (self.groups, self.fitted):
+            for sample in list(table):
+                table[sample] = {channel: entry for channel, entry in table[sample].items() if entry[0] in self.files}
+                if not table[sample]:
+                    del table[sample]
+
+    def poll(self, now: Union[float, None]=None) -> List[Tuple[str, Dict[str, pathlib.Path]]]:
+        now = time.monotonic() if now is None else now
+        seen = set()
+        for path in self.scan():
+            matched = match_file(path, self.pattern)
+            if matched is None or matched[1] not in GEOMETRY_CHANNELS[self.geometry]:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            seen.add(path)
+            size, mtime, changed = self.files.get(path, (None, None, now))
+            if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+                self.files[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            #A file is only read once its size and mtime have held for settle_time, so half written scans are skipped
+            if now - changed < self.settle_time:
+                continue
+            sample, channel = matched
+            entry = (path, size, mtime)
+            if sample not in self.groups:
+                fitted = self.fitted.get(sample, {})
+                if fitted.get(channel) == entry:
+                    continue
+                self.groups[sample] = dict(fitted) #A new or rewritten file refits the sample with the files it already had
+            self.groups[sample][channel] = entry
+        self.prune(seen)
+
+        ready = []
+        for sample, files in list(self.groups.items()):
+            complete = all(channel in files for channel in self.channels)
+            #Incomplete samples are still fit once none of their files has changed for group_timeout
+            timed_out = now - max(self.files[path][2] for path, size, mtime in files.values()) >= self.group_timeout
+            if not (complete or timed_out):
+                continue
+            del self.groups[sample]
+            if self.fitted.get(sample) != files:
+                self.fitted[sample] = files
+                ready.append((sample, {channel: path for channel, (path, size, mtime) in files.items()}))
+        return ready
+
+class RollingWriter:
+    #Appends result rows to output, starting a new numbered file once max_bytes is reached
+    def __init__(self, file_path: Union[pathlib.Path, str], file_format: Union[str, None]=None, max_bytes: int=64 * 1024 ** 2):
+        self.file_path = pathlib.Path(file_path)
+        self.file_format = file_format or self.file_path.suffix.lstrip('.').lower()
+        if self.file_format not in WATCH_FORMATS:
+            raise ValueError(f"Unsupported watch output format '{self.file_format}', use one of: {', '.join(WATCH_FORMATS)}")
+        self.max_bytes = max_bytes
+        self.part = 0
+        self.columns = None
+        self.current = self.file_path
+
+    def next_file(self) -> None:
+        self.part = self.part + 1
+        self.current = self.file_path.with_name(f'{self.file_path.stem}.{self.part}{self.file_path.suffix}')
+        self.columns = None
+
+    def append(self, rows: List[Dict]) -> str:
+        if not rows:
+            return str(self.current)
+        self.current.parent.mkdir(parents=True, exist_ok=True)
+        if self.current.exists() and self.current.stat().st_size >= self.max_bytes:
+            self.next_file()
+        if self.file_format == 'jsonl':
+            with open(self.current, 'a') as file:
+                file.writelines(json.dumps(row) + '\n' for row in rows)
+            return str(self.current)
+        import pandas as pd
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        if self.columns is not None and not set(columns) <= set(self.columns): #Csv headers can't grow, new parameters start a new file
+            self.next_file()
+        if self.columns is None:
+            self.columns = columns
+            if self.current.exists() and self.current.stat().st_size > 0: #Resuming into an existing file keeps its header
+                self.columns = list(pd.read_csv(self.current, nrows=0).columns)
+                if not set(columns) <= set(self.columns):
+                    self.next_file()
+                    self.columns = columns
+        write_header = not self.current.exists() or self.current.stat().st_size == 0
+        pd.DataFrame(rows).reindex(columns=self.columns).to_csv(self.current, mode='a', header=write_header, index=False)
+        return str(self.current)
+
+def watch(watcher: DirectoryWatcher, writer: RollingWriter, source: str, sys: str, plane: str, header: bool=False,
+          fit_mode: str='nonlinear', theta: Union[float, None]=None, scheduler: Union[FitScheduler, None]=None, use_cache: bool=True, poll_interval: float=1.0, queue_size: int=4, max_idle: float=0.0,
+          stop_event: Union[threading.Event, None]=None, callback: Union[Callable[[str, str], None], None]=None) -> int:
+    #The poller fills a bounded queue and the fitter drains it, a full queue stalls polling instead of holding more scans.
+    #Only file paths are queued, data is read when its sample is fit. Returns the number of samples fit
+    scheduler = scheduler or FitScheduler()
+    stop_event = stop_event or threading.Event()
+    callback = callback or (lambda sample, message: None)
+    models = load_fit_models()
+    samples = queue.Queue(maxsize=queue_size)
+
+    errors = []
+
+    def poll_loop():
+        try:
+            while not stop_event.is_set():
+                for item in watcher.poll():
+                    while not stop_event.is_set():
+                        try:
+                            samples.put(item, timeout=poll_interval)
+                            break
+                        except queue.Full:
+                            continue
+                stop_event.wait(poll_interval)
+        except Exception as error: #Handed to the fitting thread, which would otherwise wait on an empty queue forever
+            errors.append(error)
+            stop_event.set()
+
+    poller = threading.Thread(target=poll_loop, daemon=True)
+    poller.start()
+    fitted = 0
+    idle_since = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            try:
+                sample, files = samples.get(timeout=poll_interval)
+            except queue.Empty:
+                if max_idle > 0 and time.monotonic() - idle_since >= max_idle:
+                    break
+                continue
+            config = build_config(files, watcher.geometry, source, sys, plane, header, fit_mode, theta)
+            if isinstance(config, str):
+                callback(sample, config)
+            else:
+                fits = scheduler.run(config, models, use_cache=use_cache)
+                output = writer.append(fit_rows(sample, config, fits))
+                fitted = fitted + 1
+                callback(sample, f"{len(fits)} fits over {', '.join(config.channels)} -> {output} ({samples.qsize()} queued)")
+            idle_since = time.monotonic()
+    finally:
+        stop_event.set()
+        poller.join()
+    if errors:
+        raise errors[0]
+    return fitted
@@ -0,0 +1,93 @@
+import threading
+import traceback
+from typing import List, Tuple, Callable
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from .data_classes import FitConfig
+from .fit_engine import load_fit_models, count_fits, rank_fits
+from .fit_scheduler import FIT_SCHEDULER
+from .utils import read_data, polar_plot
+from .session import save_session
+from .metrics import METRICS
+
+class WorkerCancelled(Exception):
+    pass
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int, int) #(completed, total)
+    partial = pyqtSignal(object)
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    finished = pyqtSignal()
+
+class Worker(QRunnable):
+    def __init__(self, task: Callable, *args, **kwargs):
+        super().__init__()
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self) -> None: #Called by tasks between units of work
+        if self.cancel_event.is_set():
+            raise WorkerCancelled()
+
+    def run(self) -> None:
+        try:
+            result = self.task(self, *self.args, **self.kwargs)
+            if not self.is_cancelled():
+                self.signals.result.emit(result)
+            else:
+                self.signals.cancelled.emit()
+        except WorkerCancelled:
+            self.signals.cancelled.emit()
+        except Exception:
+            self.signals.error.emit(traceback.format_exc())
+        finally:
+            self.signals.finished.emit()
+
+def read_data_task(worker: Worker, data_sources: List[Tuple[str, str]], header: bool) -> List:
+    data_list = []
+    for data_path, channel in data_sources:
+        worker.check_cancelled()
+        data_list.append(read_data(data_path=data_path, header=header, channel=channel))
+        worker.signals.progress.emit(len(data_list), len(data_sources))
+    return data_list
+
+def save_session_task(worker: Worker, config: FitConfig, file_path: str) -> str:
+    return save_session(config, file_path)
+
+def fit_task(worker: Worker, config: FitConfig) -> List:
+    fits = {}
+    models = load_fit_models()
+    total = count_fits(config, models)
+    results = FIT_SCHEDULER.iter_fits(config, models)
+    try:
+        with METRICS.timer('fit_run_seconds'):
+            for i, fit in results:
+                worker.check_cancelled()
+                fits[i] = fit
+                worker.signals.partial.emit(fit)
+                worker.signals.progress.emit(len(fits), total)
+    finally:
+        results.close() #Cancels any jobs still queued in the process pool
+    return rank_fits([fits[i] for i in sorted(fits)])
+
+def render_task(worker: Worker, plots: List[Tuple[int, str, object, List]], width: float, height: float,
+                dpi: int, data_color: str) -> int:
+    #Figures are plain matplotlib Figures, only the Qt canvases have to be created on the GUI thread
+    for plot_id, channel, data, fits in plots:
+        worker.check_cancelled()
+        fig, ax = polar_plot(title=channel, data=data, width=width, height=height, dpi=dpi, data_color=data_color, fits=fits,
+                             pixels=width * dpi)
+        worker.signals.partial.emit((plot_id, channel, fig, fits))
+        worker.signals.progress.emit(plot_id + 1, len(plots))
+    return len(plots)